@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Grading throughput benchmark. A class of synthetic submissions with a mix
+of fast, slow, import-heavy, crashing, infinitely looping and memory-hungry
+files is graded on the worker pool at several numbers of processes, and the
+throughput, per-student latency and peak memory of each run are written as
+JSON so they can be compared between versions of the grader.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing as mp
+import hwcore
+from hwcore import GradingEngine
+
+try :
+    import resource
+except ImportError :
+    resource = None
+
+# source of each kind of submission, formatted with the options of the run
+SUBMISSIONS = {
+    'fast' : '''
+def answer(x) :
+    return x*x
+
+def work(n) :
+    return sum(range(n))
+''',
+    'slow' : '''
+def answer(x) :
+    return x*x
+
+def work(n) :
+    s = 0
+    for i in range({slow}) :
+        s += i
+    return sum(range(n))
+''',
+    'heavy' : '''
+import csv, decimal, fractions, json, statistics
+_table = [i*i for i in range({heavy})]
+
+def answer(x) :
+    return _table[x]
+
+def work(n) :
+    return sum(range(n))
+''',
+    'crash' : '''
+def answer(x) :
+    return x*x
+
+raise RuntimeError('submission is broken')
+''',
+    'loop' : '''
+def answer(x) :
+    return x*x
+
+def work(n) :
+    while n > 0 :
+        n += 1
+''',
+    'memory' : '''
+def answer(x) :
+    return x*x
+
+def work(n) :
+    data = []
+    while True :
+        data.append(bytearray(2**20))
+''',
+}
+
+TESTS = '''
+from hwcore import HWTestBase
+
+class TestBench(HWTestBase) :
+
+    def test_answer(self) :
+        """Squares a number, points=1"""
+        self.assertEqual(self.module.answer(3), 9)
+
+    def test_work(self) :
+        """Sums a range, points=2"""
+        self.assertEqual(self.module.work(10), 45)
+'''
+
+DEFAULT_MIX = 'fast=60,slow=15,heavy=10,crash=5,loop=5,memory=5'
+
+
+def parseMix(mix) :
+    """Returns a dictionary of kind/weight pairs from 'kind=weight,...'"""
+    weights = {}
+    for item in mix.split(',') :
+        kind, weight = item.split('=')
+        if kind not in SUBMISSIONS :
+            raise ValueError('unknown kind of submission ' + kind)
+        weights[kind] = float(weight)
+    return weights
+
+def studentName(i) :
+    """Returns a name made of letters for student i, since the submission
+    pattern doesn't allow digits in names"""
+    letters = ''
+    while True :
+        letters = chr(ord('a') + i % 26) + letters
+        i = i // 26
+        if i == 0 :
+            return letters
+
+def generate(directory, students, weights, seed=0, slow=3*10**6, heavy=10**6) :
+    """
+    Writes the test module and the synthetic submissions of a class
+
+    Arguments :
+        directory : str
+            directory the test module is written to, the submissions go to
+            its 'submissions' folder
+        students : int
+            number of submissions
+        weights : dict
+            relative number of submissions of each kind
+        seed : int
+            seed of the order the kinds are shuffled in
+        slow : int
+            loop iterations of a slow submission
+        heavy : int
+            size of the table built when a heavy submission is imported
+
+    Returns :
+        kinds : dict
+            dictionary of module name/kind pairs
+    """
+
+    with open(os.path.join(directory, 'bench_tests.py'), 'w') as f :
+        f.write(TESTS)
+    submissions = os.path.join(directory, 'submissions')
+    os.makedirs(submissions)
+    total = sum(weights.values())
+    order = []
+    for kind, weight in weights.items() :
+        order += [kind]*round(students*weight/total)
+    order = (order + ['fast']*students)[:students]
+    random.Random(seed).shuffle(order)
+    kinds = {}
+    for i, kind in enumerate(order) :
+        name = kind + '_' + studentName(i) + '_hw1'
+        with open(os.path.join(submissions, name + '.py'), 'w') as f :
+            f.write(SUBMISSIONS[kind].format(slow=slow, heavy=heavy))
+        kinds[name] = kind
+    return kinds
+
+def peakRSS() :
+    """Returns the peak resident memory of this process in MB"""
+    if resource is None :
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return rss/2**20 if sys.platform == 'darwin' else rss/2**10
+
+_silenced = []
+
+def timedGradeTask(task) :
+    """
+    Grades a (suite, name) task like hwcore.gradeTask, with the output of
+    the worker discarded, and returns (data, seconds, peak RSS in MB)
+    """
+
+    if not _silenced :
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        _silenced.append(devnull)
+    start = time.perf_counter()
+    suite, data = hwcore.gradeTask(task)
+    return data, time.perf_counter() - start, peakRSS()
+
+def workerReady(_) :
+    """Returns the pid of the worker, slowly enough for every worker to
+    get a task"""
+    time.sleep(0.05)
+    return os.getpid()
+
+def percentile(values, q) :
+    """Returns the q-th percentile of values by the nearest rank"""
+    values = sorted(values)
+    rank = max(int(-(-q*len(values)//100)), 1)
+    return values[rank - 1]
+
+def benchmark(directory, kinds, processes, args) :
+    """
+    Grades the submissions in directory on a new pool and returns the
+    measurements of the run
+
+    Arguments :
+        directory : str
+            directory with the submissions
+        kinds : dict
+            dictionary of module name/kind pairs
+        processes : int
+            number of worker processes
+        args : parsed command line arguments
+    """
+
+    limits = {'timeout': args.test_timeout, 'cpu': args.cpu_limit,
+              'memory': args.memory_limit}
+    tasks = [(0, name) for name in kinds]
+    latencies = {}
+    statuses = {}
+    worker_rss = 0
+    start = time.perf_counter()
+    with GradingEngine([('bench_tests', 'TestBench', directory)], processes, limits,
+                       args.import_timeout, args.start_method, 0, args.isolate) as engine :
+        # wait for every worker to import the tests before timing grading
+        pids = set()
+        while len(pids) < processes :
+            pids.update(engine.pool.map(workerReady, range(processes), chunksize=1))
+        started = time.perf_counter()
+        for _ in engine.precheck(tasks, args.chunksize) :
+            pass
+        prechecked = time.perf_counter()
+        for data, seconds, rss in engine.pool.imap_unordered(timedGradeTask, tasks,
+                                                             args.chunksize) :
+            for name, result in data.items() :
+                latencies[name] = seconds
+                for test in result.get('tests', {}).values() :
+                    statuses[test['status']] = statuses.get(test['status'], 0) + 1
+                if 'tests' not in result :
+                    statuses['import'] = statuses.get('import', 0) + 1
+            worker_rss = max(worker_rss, rss or 0)
+        graded = time.perf_counter()
+
+    values = list(latencies.values())
+    by_kind = {}
+    for name, seconds in latencies.items() :
+        by_kind.setdefault(kinds[name], []).append(seconds)
+    return {
+        'processes': processes,
+        'startup_seconds': started - start,
+        'precheck_seconds': prechecked - started,
+        'grade_seconds': graded - prechecked,
+        'submissions_per_second': len(values)/(graded - started),
+        'latency_seconds': {'p50': percentile(values, 50), 'p99': percentile(values, 99),
+                            'max': max(values), 'mean': sum(values)/len(values)},
+        'latency_by_kind': {kind: sum(seconds)/len(seconds)
+                            for kind, seconds in sorted(by_kind.items())},
+        'statuses': statuses,
+        'peak_rss_mb': {'worker': worker_rss, 'parent': peakRSS()},
+    }
+
+def systemInfo() :
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'system': platform.system(),
+        'release': platform.release(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'start_method': mp.get_start_method(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--students", help="number of synthetic submissions",
+                        default=200, type=int)
+    parser.add_argument("-mx", "--mix", help="relative number of each kind of submission",
+                        default=DEFAULT_MIX)
+    parser.add_argument("-pr", "--processes", help="numbers of parallel processes to benchmark",
+                        default=[1, 2, 4], type=int, nargs='+')
+    parser.add_argument("-o", "--output", help="JSON file the results are written to",
+                        default="benchmark.json")
+    parser.add_argument("-sd", "--seed", help="seed of the order of the submissions",
+                        default=0, type=int)
+    parser.add_argument("-it", "--import_timeout", help="seconds allowed for importing a submission",
+                        default=10, type=float)
+    parser.add_argument("-tt", "--test_timeout", help="wall-clock seconds allowed for each test",
+                        default=1, type=float)
+    parser.add_argument("-ct", "--cpu_limit", help="CPU seconds allowed for each test",
+                        default=2, type=float)
+    parser.add_argument("-ml", "--memory_limit", help="megabytes of memory allowed for each test",
+                        default=256, type=float)
+    parser.add_argument("-cs", "--chunksize", help="number of submissions handed to a process at a time",
+                        default=1, type=int)
+    parser.add_argument("-sm", "--start_method", help="how worker processes are started, default is the platform's",
+                        default=None, choices=mp.get_all_start_methods())
+    parser.add_argument("-is", "--isolate", help="run each test in its own fork of the imported submission, this many at a time, 0 never",
+                        default=0, type=int)
+    parser.add_argument("-k", "--keep", help="keep the directory of synthetic submissions",
+                        action="store_true")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='hwbench_')
+    kinds = generate(directory, args.students, parseMix(args.mix), args.seed)
+    sys.path.append(directory)
+    submissions = os.path.join(directory, 'submissions')
+    try :
+        runs = []
+        for processes in args.processes :
+            print('Benchmarking {} students on {} processes'.format(args.students, processes))
+            runs.append(benchmark(submissions, kinds, processes, args))
+            runs[-1]['speedup'] = runs[0]['grade_seconds']/runs[-1]['grade_seconds']
+            print('  {submissions_per_second:.1f} submissions/s, '
+                  'p50 {p50:.3f} s, p99 {p99:.3f} s, '
+                  'worker peak RSS {worker:.0f} MB'.format(**runs[-1],
+                                                           **runs[-1]['latency_seconds'],
+                                                           **runs[-1]['peak_rss_mb']))
+    finally :
+        if args.keep :
+            print('Submissions kept in ' + submissions)
+        else :
+            shutil.rmtree(directory)
+
+    counts = {}
+    for kind in kinds.values() :
+        counts[kind] = counts.get(kind, 0) + 1
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'system': systemInfo(),
+        'config': {'students': args.students, 'mix': counts, 'seed': args.seed,
+                   'import_timeout': args.import_timeout,
+                   'test_timeout': args.test_timeout, 'cpu_limit': args.cpu_limit,
+                   'memory_limit': args.memory_limit, 'chunksize': args.chunksize,
+                   'start_method': args.start_method or mp.get_start_method(),
+                   'isolate': args.isolate},
+        'runs': runs,
+    }
+    with open(args.output, 'w') as f :
+        json.dump(report, f, indent=2)
+    print('Results written to ' + args.output)
@@ -0,0 +1,1233 @@
+"""
+Grading core: loads the tests of a HWTestBase class, runs them against a
+student module under time and resource budgets and collects the results.
+Kept free of numerical and plotting imports so that workers and test modules
+start fast.
+"""
+
+import unittest
+import re
+import sys
+import importlib
+import importlib.util
+import os
+import signal
+import math
+import time
+import pickle
+import hashlib
+import select
+import queue
+import functools
+from sys import platform
+import multiprocessing as mp
+import hwprecheck
+import hwimport
+from hwimport import Submissions, readSubmission
+import hwsimilarity
+try:
+    import resource
+except ImportError:
+    # resource limits are only available on unix
+    resource = None
+
+
+class StudentTestLoader(unittest.TestLoader):
+       
+    def loadTestsFromTestCase(self, testCaseClass, testNames=None, **kwargs):
+        """Return a suite of all tests cases contained in testCaseClass,
+        or of those in testNames, e.g. from a TestPlan, without looking
+        them up again."""
+        if testNames is None :
+            testNames = self.getTestCaseNames(testCaseClass)
+        testCases = []
+        for testCaseName in testNames:
+            testCases.append(testCaseClass(testCaseName, **kwargs))
+        loadedSuite = self.suiteClass(testCases)
+        return loadedSuite
+
+class StudentRunner:
+    """Run the TestCase for a student module.
+    """
+
+    def __init__(self, stream=sys.stderr, limits=None, isolate=0, plan=None, capture=None):
+        self.stream = stream
+        self.limits = limits or {}
+        self.plan = plan
+        self.capture = capture or OutputCapture()
+        self.isolate = isolate if hasattr(os, 'fork') else 0
+        self.msg = ''
+
+    def writeUpdate(self, message):
+        self.stream.write(message)
+
+    def run(self, test, mod):
+        """ Run the given test case or test suite.  """
+        result = StudentTestResult(self, self.limits, self.plan)
+        # The following updates will be written in the terminal
+        self.msg = "*"*70+"\n"
+        self.msg +="STUDENT: " + mod.__name__+"\n"
+        if self.isolate :
+            self.runIsolated(test, result)
+        else :
+            test(result)
+        result.process()
+        self.msg +="TOTAL: {}\n".format(result.data['total'])
+        self.msg +="SCORE: {}\n".format(result.data['score'])
+        self.msg +="~"*70+"\n\n"
+        self.writeUpdate(self.msg)
+        return result
+
+    def runIsolated(self, test, result):
+        """ Run every test case in its own forked copy of the already
+        imported student module, up to self.isolate of them at a time, so
+        no test can see changes another one made to the module. """
+        pending = list(unittest.TestSuite(test))
+        order = [case._testMethodName for case in pending]
+        tests = {}
+        running = {}
+        while pending or running :
+            while pending and len(running) < self.isolate :
+                # a test waits for the prerequisites that are still running
+                ready = [case for case in pending
+                         if all(name in tests or name not in order
+                                for name in result.metadata(case)['requires'])]
+                if not ready and running :
+                    break
+                case = (ready or pending)[0]
+                pending.remove(case)
+                reason = result.skipReason(case, tests)
+                if reason :
+                    child_tests, msg = result.skippedEntry(case, reason)
+                    tests.update(child_tests)
+                    self.msg += msg
+                    continue
+                r, w = os.pipe()
+                pid = os.fork()
+                if pid == 0 :
+                    os.close(r)
+                    self.runChild(case, w, tests)
+                os.close(w)
+                running[r] = {'pid': pid, 'case': case, 'chunks': []}
+            if not running :
+                continue
+            ready, _, _ = select.select(list(running), [], [])
+            for r in ready :
+                chunk = os.read(r, 65536)
+                if chunk :
+                    running[r]['chunks'].append(chunk)
+                    continue
+                os.close(r)
+                child = running.pop(r)
+                _, status = os.waitpid(child['pid'], 0)
+                try :
+                    child_tests, msg = pickle.loads(b''.join(child['chunks']))
+                except Exception :
+                    # the child died before it could report back
+                    child_tests, msg = result.crashed(child['case'], status)
+                for entry in child_tests.values() :
+                    if 'output' in entry :
+                        self.capture.charge(entry['output'])
+                tests.update(child_tests)
+                self.msg += msg
+        for name in order :
+            if name in tests :
+                result.data['tests'][name] = tests[name]
+
+    def runChild(self, case, w, tests):
+        """ Runs a single test case in a forked child, sends its results
+        through the pipe w and exits. tests holds the data of the tests
+        that ran before it. """
+        code = 0
+        try :
+            self.msg = ''
+            result = StudentTestResult(self, self.limits, self.plan)
+            result.prior = tests
+            unittest.TestSuite([case])(result)
+            result.process()
+            payload = pickle.dumps((result.data['tests'], self.msg))
+            with os.fdopen(w, 'wb') as f :
+                f.write(payload)
+        except BaseException :
+            code = 1
+        finally :
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+class StudentTestResult(unittest.TestResult):
+
+    def __init__(self, runner, limits=None, plan=None):
+        unittest.TestResult.__init__(self)
+        self.runner = runner
+        self.limits = limits or {}
+        self.plan = plan
+        # data of tests that ran in other processes, see runIsolated
+        self.prior = {}
+        self.budget = None
+        self.started = None
+        self.data = {}
+        self.data['tests'] = {}
+
+    def startTest(self, test):
+        unittest.TestResult.startTest(self, test)
+
+        # points, description and budgets come from the compiled plan
+        entry = self.metadata(test)
+        points = entry['points']
+        self.runner.msg += '{0}, {1}, {2} '.format(test._testMethodName, points, entry['description'])
+        reason = self.skipReason(test)
+        self.data['tests'][test._testMethodName] = {}
+        self.data['tests'][test._testMethodName]['points'] = points
+        self.data['tests'][test._testMethodName]['description'] = entry['description']
+        if reason :
+            # unittest skips a method marked like unittest.skip marks it,
+            # without running setUp or tearDown
+            def skipped() :
+                pass
+            skipped.__unittest_skip__ = True
+            skipped.__unittest_skip_why__ = reason
+            setattr(test, test._testMethodName, skipped)
+            return
+        self.budget = budget(**entry['limits'])
+        self.budget.__enter__()
+        self.runner.capture.__enter__()
+
+        # setUp, the test method and tearDown are timed separately
+        timings = self.data['tests'][test._testMethodName]['timings'] = {}
+        for method, key in (('setUp', 'setUp'), (test._testMethodName, 'test'),
+                            ('tearDown', 'tearDown')) :
+            setattr(test, method, timed(getattr(test, method), timings, key))
+        self.started = time.perf_counter()
+
+    def stopTest(self, test):
+        self.runner.capture.__exit__(None, None, None)
+        output = self.runner.capture.take()
+        if output :
+            self.data['tests'][test._testMethodName]['output'] = output
+        if self.started is not None :
+            timings = self.data['tests'][test._testMethodName]['timings']
+            timings['total'] = time.perf_counter() - self.started
+            self.started = None
+        if self.budget is not None :
+            self.budget.__exit__(None, None, None)
+            self.budget = None
+        unittest.TestResult.stopTest(self, test)
+
+    def addSuccess(self, test):
+        unittest.TestResult.addSuccess(self, test)
+        self.data['tests'][test._testMethodName]['status'] = 'pass'
+        self.runner.msg += 'PASS\n'
+
+    def addError(self, test, err):
+        err = (err[0], err[1], untimed(err[2]))
+        unittest.TestResult.addError(self, test, err)
+        # tests that ran over their budget get a status of their own so they
+        # are not confused with errors in the student's code
+        if issubclass(err[0], TimeoutError) :
+            status = 'timeout'
+        elif issubclass(err[0], (ResourceLimitError, MemoryError)) :
+            status = 'resource'
+        else :
+            status = 'error'
+        self.data['tests'][test._testMethodName]['status'] = status
+        if issubclass(err[0], MemoryError) and self.budget and self.budget.memory :
+            message = 'Test used more than {:g} MB of memory'.format(self.budget.memory)
+        else :
+            message = str(err[1]) or 'Test ran out of memory'
+        if status != 'error' :
+            self.data['tests'][test._testMethodName]['message'] = message + '\n'
+        self.runner.msg += status.upper() + '\n'
+
+    def addFailure(self, test, err):
+        err = (err[0], err[1], untimed(err[2]))
+        unittest.TestResult.addFailure(self, test, err)
+        self.data['tests'][test._testMethodName]['status'] = 'failure'
+        self.runner.msg += 'FAIL\n'
+
+    def addSkip(self, test, reason):
+        unittest.TestResult.addSkip(self, test, reason)
+        self.data['tests'][test._testMethodName]['status'] = 'skipped'
+        self.data['tests'][test._testMethodName]['message'] = reason + '\n'
+        self.runner.msg += 'SKIPPED\n'
+
+    def skipReason(self, test, tests=None):
+        """ Returns why the test is skipped without running it, or None if
+        it runs. A test is skipped when a test it requires did not pass, or
+        when the student has already failed the 'failures' limit of tests.
+        'tests' holds the data of the tests that ran so far, by default
+        those of this result. """
+        if tests is None :
+            tests = dict(self.prior, **self.data['tests'])
+        unmet = [name for name in self.metadata(test)['requires']
+                 if tests.get(name, {}).get('status') != 'pass']
+        if unmet :
+            return 'Skipped because {} did not pass'.format(', '.join(unmet))
+        failures = self.limits.get('failures')
+        if failures :
+            failed = sum(1 for entry in tests.values()
+                         if entry.get('status') not in (None, 'pass', 'skipped'))
+            if failed >= failures :
+                return 'Skipped after {} tests did not pass'.format(failed)
+        return None
+
+    def skippedEntry(self, test, reason):
+        """ Returns the test data and terminal message of a test that is
+        skipped without running it. """
+        metadata = self.metadata(test)
+        entry = {'points': metadata['points'], 'description': metadata['description'],
+                 'status': 'skipped', 'message': reason + '\n'}
+        msg = '{0}, {1}, {2} SKIPPED\n'.format(test._testMethodName, entry['points'],
+                                               entry['description'])
+        return {test._testMethodName: entry}, msg
+
+    def metadata(self, test):
+        """ Returns the entry of the test in the plan, or reads it from the
+        docstring when running without one. """
+        if self.plan is not None and test._testMethodName in self.plan.tests :
+            return self.plan.tests[test._testMethodName]
+        return testMetadata(test, self.limits)
+
+    def crashed(self, test, status):
+        """ Returns the test data and terminal message of a test whose
+        forked process died with wait status 'status' before reporting. """
+        metadata = self.metadata(test)
+        entry = {'points': metadata['points'], 'description': metadata['description']}
+        if os.WIFSIGNALED(status) :
+            entry['status'] = 'resource'
+            entry['message'] = 'Test was killed by signal {}\n'.format(os.WTERMSIG(status))
+        else :
+            entry['status'] = 'error'
+            entry['raw'] = 'Test process exited with status {}\n'.format(os.WEXITSTATUS(status))
+        msg = '{0}, {1}, {2} {3}\n'.format(test._testMethodName, entry['points'],
+                                           entry['description'], entry['status'].upper())
+        return {test._testMethodName: entry}, msg
+
+    def process(self):
+        
+        # add the raw messages from exceptions due to errors
+        for test, raw in self.errors:
+            self.data['tests'][test._testMethodName]['raw'] = raw
+        # do the same for exceptions raided from test failures
+        for test, raw in self.failures:
+            self.data['tests'][test._testMethodName]['raw'] = raw
+            # extract the short message from failed test for delivery
+            # to the student
+            msg_idx = raw.rfind(':')
+            if msg_idx > -1:
+                self.data['tests'][test._testMethodName]['message'] = raw[msg_idx+2:]
+        # compute total points
+        score = 0
+        total = 0
+        for test in self.data['tests'].keys():
+            points = self.data['tests'][test]['points']
+            total += points
+            if self.data['tests'][test]['status'] == 'pass':
+                score += points
+        self.data['score'] = score
+        self.data['total'] = total
+        self.data['percent'] = 100*score/total
+        
+class timeout:
+    """
+    Class designed to handle infinite while loops. Returns TimeoutError
+    after the specified time, and keeps raising it every second after that
+    in case the student code swallows the first one.
+    """
+    def __init__(self, seconds=5, error_message='Timeout'):
+        self.seconds = seconds
+        self.error_message = error_message
+    def handle_timeout(self, signum, frame):
+        raise TimeoutError(self.error_message)
+    def __enter__(self):
+        if hasattr(signal, 'SIGALRM') :
+            self.previous = signal.signal(signal.SIGALRM, self.handle_timeout)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds, 1)
+    def __exit__(self, type, value, traceback):
+        if hasattr(signal, 'SIGALRM') :
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous)
+
+def testMetadata(test, limits=None):
+    """
+    Returns what a test declares in its docstring: its points, which
+    default to 1, the description shown to students, its budgets, starting
+    from the default limits, its tags and the tests it requires to pass
+    before it can run, e.g.
+
+        points=2 timeout=30 cpu=20 memory=2048 tags=plots,numpy requires=test_a
+
+    Arguments :
+        test : unittest.TestCase
+            instance of the test
+        limits : dict
+            default 'timeout', 'cpu' and 'memory' budgets, other limits
+            are left out
+    """
+    doc = test._testMethodDoc or ''
+    points = re.findall(r'(?<=points=)\d+', doc)
+    entry = {'points': int(points[0]) if points else 1,
+             'declared': bool(points),
+             'description': test.shortDescription()}
+    limits = limits or {}
+    entry['limits'] = {key: limits[key] for key in ('timeout', 'cpu', 'memory') if key in limits}
+    for key in ('timeout', 'cpu', 'memory') :
+        value = re.findall(r'(?<={}=)\d+(?:\.\d+)?'.format(key), doc)
+        if value :
+            entry['limits'][key] = float(value[0])
+    tags = re.findall(r'(?<=tags=)[\w,]+', doc)
+    entry['tags'] = tags[0].split(',') if tags else []
+    requires = re.findall(r'(?<=requires=)[\w,]+', doc)
+    entry['requires'] = requires[0].split(',') if requires else []
+    return entry
+
+class TestPlan:
+    """
+    Compiled metadata of the tests of a HWTestBase class. It is built once
+    in the parent and shipped to the workers when they start, so grading a
+    student only runs the tests instead of discovering them and parsing
+    their docstrings again.
+
+    Arguments :
+        test_class : HWTestBase class
+            class containing the tests
+        limits : dict
+            default 'timeout', 'cpu' and 'memory' budgets for each test
+    """
+
+    def __init__(self, test_class, limits=None):
+        self.test_class = test_class.__name__
+        self.names = StudentTestLoader().getTestCaseNames(test_class)
+        self.tests = {name: testMetadata(test_class(name, None), limits)
+                      for name in self.names}
+        self.total = sum(entry['points'] for entry in self.tests.values())
+
+    def validate(self):
+        """Raises ValueError if the class has no tests, a test has no
+        description or doesn't declare its points, or requires a test that
+        doesn't run before it"""
+        problems = []
+        if not self.names :
+            problems.append('there are no tests')
+        for i, (name, entry) in enumerate(self.tests.items()) :
+            if not entry['description'] :
+                problems.append(name + ' has no docstring')
+            elif not entry['declared'] :
+                problems.append(name + ' does not declare points=')
+            for required in entry['requires'] :
+                if required not in self.tests :
+                    problems.append(name + ' requires ' + required + ', which is not a test')
+                elif self.names.index(required) >= i :
+                    problems.append(name + ' requires ' + required + ', which runs after it')
+        if problems :
+            raise ValueError(self.test_class + ': ' + '; '.join(problems))
+
+def timed(method, timings, key):
+    """
+    Wraps method so that the seconds each call takes are stored in
+    timings[key]. The frame of the wrapper is left out of the tracebacks
+    of errors and failures by untimed.
+    """
+    @functools.wraps(method)
+    def timedCall(*args, **kwargs):
+        start = time.perf_counter()
+        try :
+            return method(*args, **kwargs)
+        finally :
+            timings[key] = time.perf_counter() - start
+    return timedCall
+
+def untimed(tb):
+    """
+    Returns traceback tb with the frames of the wrappers made by timed
+    unlinked, so tracebacks read as if the test was called directly
+    """
+    def wrapped(tb) :
+        return (tb is not None and tb.tb_frame.f_code.co_name == 'timedCall'
+                and tb.tb_frame.f_globals is globals())
+    while wrapped(tb) :
+        tb = tb.tb_next
+    head = tb
+    while tb is not None :
+        while wrapped(tb.tb_next) :
+            tb.tb_next = tb.tb_next.tb_next
+        tb = tb.tb_next
+    return head
+
+class ResourceLimitError(Exception):
+    """
+    Raised when student code uses more CPU time than its budget allows
+    """
+
+def addressSpace() :
+    """
+    Returns the number of bytes of address space the current process uses,
+    or 0 if it can't be determined
+    """
+    try :
+        with open('/proc/self/statm') as f :
+            pages = int(f.read().split()[0])
+    except (OSError, ValueError, IndexError) :
+        return 0
+    return pages*resource.getpagesize()
+
+def resetPeakMemory() :
+    """
+    Resets the peak resident memory of the current process, which linux
+    allows through /proc/self/clear_refs. Returns False if it can't be reset.
+    """
+    try :
+        with open('/proc/self/clear_refs', 'w') as f :
+            f.write('5')
+    except OSError :
+        return False
+    return True
+
+def peakMemory() :
+    """
+    Returns the peak resident memory of the current process in MB since it
+    was last reset, or None if it can't be determined
+    """
+    try :
+        with open('/proc/self/status') as f :
+            for line in f :
+                if line.startswith('VmHWM:') :
+                    return int(line.split()[1])/1024
+    except (OSError, ValueError, IndexError) :
+        pass
+    return None
+
+class budget:
+    """
+    Class that enforces the wall-clock, CPU and memory budgets of a test.
+    CPU time and memory are measured from the moment the budget is entered,
+    so a long-lived worker gives every test the same allowance. Limits that
+    are None or 0 are not enforced.
+
+    Arguments :
+        timeout : float
+            wall-clock seconds before a TimeoutError is raised
+        cpu : float
+            CPU seconds before a ResourceLimitError is raised
+        memory : float
+            megabytes the code may allocate before a MemoryError is raised
+    """
+    def __init__(self, timeout=None, cpu=None, memory=None):
+        self.seconds = timeout
+        self.cpu = cpu
+        self.memory = memory
+        self.timer = None
+        self.cpu_limit = None
+        self.memory_limit = None
+    def handle_cpu(self, signum, frame):
+        raise ResourceLimitError('Test used more than {:g} seconds of CPU time'.format(self.cpu))
+    def __enter__(self):
+        if self.seconds :
+            self.timer = timeout(self.seconds,
+                                 'Test took longer than {:g} seconds'.format(self.seconds))
+            self.timer.__enter__()
+        if resource is None :
+            return self
+        if self.cpu :
+            self.cpu_limit = resource.getrlimit(resource.RLIMIT_CPU)
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = math.ceil(usage.ru_utime + usage.ru_stime + self.cpu)
+            hard = self.cpu_limit[1]
+            if hard != resource.RLIM_INFINITY :
+                soft = min(soft, hard)
+            self.previous = signal.signal(signal.SIGXCPU, self.handle_cpu)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        if self.memory :
+            self.memory_limit = resource.getrlimit(resource.RLIMIT_AS)
+            soft = addressSpace() + int(self.memory*2**20)
+            hard = self.memory_limit[1]
+            if hard != resource.RLIM_INFINITY :
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+        return self
+    def __exit__(self, type, value, traceback):
+        if self.memory_limit is not None :
+            resource.setrlimit(resource.RLIMIT_AS, self.memory_limit)
+            self.memory_limit = None
+        if self.cpu_limit is not None :
+            resource.setrlimit(resource.RLIMIT_CPU, self.cpu_limit)
+            signal.signal(signal.SIGXCPU, self.previous)
+            self.cpu_limit = None
+        if self.timer is not None :
+            self.timer.__exit__(type, value, traceback)
+            self.timer = None
+
+class OutputCapture:
+    """
+    Bounded buffer for what a submission prints while it is imported and
+    tested. sys.stdout and sys.stderr are swapped for the buffer while it
+    is entered, and once 'limit' bytes of the submission's output are kept
+    the rest is only counted. Output written straight to the file
+    descriptors, e.g. by a subprocess, is not captured.
+
+    Arguments :
+        limit : int
+            bytes kept of the submission's output, 0 to not capture it and
+            leave it on the console
+    """
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.chunks = []
+        self.used = 0
+        self.dropped = 0
+        self.saved = None
+    def __enter__(self):
+        if self.limit :
+            self.saved = sys.stdout, sys.stderr
+            sys.stdout = sys.stderr = self
+        return self
+    def __exit__(self, type, value, traceback):
+        if self.saved is not None :
+            sys.stdout, sys.stderr = self.saved
+            self.saved = None
+    def write(self, text):
+        if self.used >= self.limit :
+            self.dropped += len(text.encode('utf-8', 'replace'))
+            return len(text)
+        data = text.encode('utf-8', 'replace')
+        room = self.limit - self.used
+        if len(data) > room :
+            self.dropped += len(data) - room
+            data = data[:room]
+        self.chunks.append(data.decode('utf-8', 'ignore'))
+        self.used += len(data)
+        return len(text)
+    def flush(self):
+        pass
+    def isatty(self):
+        return False
+    def charge(self, text):
+        """Counts output kept by a forked test against the limit"""
+        self.used += len(text.encode('utf-8', 'replace'))
+    def take(self):
+        """Returns what was captured since the last call, with a note of
+        how much was cut off"""
+        text = ''.join(self.chunks)
+        if self.dropped :
+            text += '\n[... {} more bytes of output not kept]\n'.format(self.dropped)
+        self.chunks = []
+        self.dropped = 0
+        return text
+
+class HWTestBase(unittest.TestCase):
+    """
+    Base class for tests to be imported to tester
+    """
+    
+    def __init__(self, testname, module):
+        super().__init__(testname)
+        self.module = module
+
+    @classmethod
+    def prepare(cls):
+        """
+        Called once before any submission is graded, in the grading
+        process rather than in the workers, e.g. to compute the outputs of
+        a reference solution, see hwreference
+        """
+        
+               
+def runTests(name, test_class, limits=None, import_timeout=10, isolate=0, profile=None,
+             tests=None, plan=None):
+    """
+    Runs tests in test class for all of the filename 'name'
+    
+    Arguments :
+        names : str
+            str of filename to be tested
+        test_class : HWTestBase class
+            class based on HWTestBase containing tests to be run
+        limits : dict
+            default 'timeout', 'cpu' and 'memory' budgets for each test,
+            which a test's docstring may override, the most 'traceback'
+            characters kept of a failure and the 'output' bytes kept of
+            what the module prints, 0 to leave it on the console
+        import_timeout : float
+            seconds allowed for importing the module
+        isolate : int
+            if nonzero, run each test in a forked copy of the imported
+            module, this many at a time
+        profile : str
+            file the cProfile stats of importing and testing the module are
+            written to, None to not profile it
+        tests : list
+            names of the test methods to run, None to run all of them
+        plan : TestPlan
+            compiled plan of test_class, None to read the tests from the
+            class
+            
+    Returns :
+        data : dict
+            dictionairy with name as key to dictionary containing
+            test results, the seconds spent importing and testing it, the
+            peak memory in MB while doing so and what it printed while
+            imported, what each test printed is in the test's results.
+            When importing fails, 'import_status' is 'timeout', 'resource'
+            or 'error' instead of there being test results.
+    """
+    
+    limits = limits or {}
+    data = {}
+    print("Testing ", name)
+    data[name] = {}
+    if platform in ['win32', 'win64'] :
+        print("I'm on Windoze and can't use signal!!!")
+    if profile :
+        # only imported when asked for, like the plotting libraries
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    tracking = resetPeakMemory()
+    timings = {}
+    capture = OutputCapture(limits.get('output', 0))
+    imported = ''
+    started = time.perf_counter()
+    try:
+        with budget(timeout=import_timeout, cpu=limits.get('cpu'),
+                    memory=limits.get('memory')), capture :
+            mod = importlib.import_module(name)
+    except TimeoutError :
+        data[name]['total'] = 0
+        data[name]['percent'] = 0
+        data[name]['comment'] = 'Likely an infinite while loop!'
+        data[name]['import_status'] = 'timeout'
+        print("Likely an infinite while loop!\n")
+    except (ResourceLimitError, MemoryError) :
+        data[name]['total'] = 0
+        data[name]['percent'] = 0
+        data[name]['comment'] = 'Importing went over the CPU or memory limit.'
+        data[name]['import_status'] = 'resource'
+        print("importing went over the CPU or memory limit!\n")
+    except:
+        data[name]['total'] = 0
+        data[name]['percent'] = 0
+        data[name]['comment'] = 'Importing led to an error.'
+        data[name]['import_status'] = 'error'
+        print("importing led to an error!\n")
+    else:
+        timings['import'] = time.perf_counter() - started
+        # what importing printed, the tests keep what they print
+        imported = capture.take()
+        try:
+            loader = StudentTestLoader()
+            if tests is None and plan is not None :
+                tests = plan.names
+            suite = loader.loadTestsFromTestCase(test_class, testNames=tests, module=mod)
+            result = StudentRunner(limits=limits, isolate=isolate, plan=plan,
+                                   capture=capture).run(suite, mod)
+            data[name] = result.data
+            normalizeFailures(data[name], name, mod, limits.get('traceback', 0))
+        except:
+            data[name]['total'] = 0
+            data[name]['percent'] = 0
+            data[name]['comment'] = 'Test suite failed.'
+            print("test suite failed!")
+        timings['tests'] = time.perf_counter() - started - timings['import']
+    timings['total'] = time.perf_counter() - started
+    timings.setdefault('import', timings['total'])
+    data[name]['timings'] = timings
+    output = imported + capture.take()
+    if output :
+        data[name]['output'] = output
+    if tracking :
+        data[name]['peak_memory'] = peakMemory()
+    if profile :
+        profiler.disable()
+        profiler.dump_stats(profile)
+    return data
+
+def normalizeTraceback(raw, name, filename=None, limit=0) :
+    """
+    Returns a traceback with what differs between students who made the
+    same mistake taken out, so their failures have the same signature
+
+    Arguments :
+        raw : str
+            traceback of a failed test
+        name : str
+            module name of the submission, replaced by <submission>
+        filename : str
+            path of the submission, also replaced by <submission>
+        limit : int
+            most characters kept, from the start and the end of the
+            traceback, 0 for all of them
+    """
+
+    if filename :
+        raw = raw.replace(filename, '<submission>')
+    raw = re.sub(r'\b' + re.escape(name) + r'\b', '<submission>', raw)
+    raw = re.sub(r'0x[0-9a-fA-F]+', '0x?', raw)
+    if limit and len(raw) > limit :
+        # the exception and its message are at the end
+        head = limit//4
+        tail = limit - head
+        raw = '{}\n... {} characters omitted ...\n{}'.format(
+            raw[:head], len(raw) - limit, raw[-tail:])
+    return raw
+
+def failureSignature(test, raw) :
+    """Returns the signature of a failure, a short hash of the test and its
+    normalized traceback"""
+    return hashlib.sha1((test + '\n' + raw).encode()).hexdigest()[:12]
+
+def normalizeFailures(data, name, mod=None, limit=0) :
+    """Normalizes and caps the traceback of every test in the result data
+    of submission 'name', see normalizeTraceback, and adds its signature"""
+    filename = getattr(mod, '__file__', None)
+    for test, entry in data.get('tests', {}).items() :
+        if 'raw' in entry :
+            entry['raw'] = normalizeTraceback(entry['raw'], name, filename, limit)
+            entry['signature'] = failureSignature(test, entry['raw'])
+
+# state of a grading worker, filled in once by initWorker when it starts
+_worker = {}
+
+def initWorker(suites, limits, import_timeout, path, isolate=0, profile=None, plans=None,
+               events=None, quiet=False) :
+    """
+    Prepares a grading worker by importing the test classes once, so tasks
+    only need to carry the name of the submission and which suite it is
+    graded with
+
+    Arguments :
+        suites : list
+            (test module, test class, submissions) of every suite of tests
+            the worker grades with, where submissions is a Submissions or
+            the path of a folder of them
+        limits : dict
+            default budgets for each test
+        import_timeout : float
+            seconds allowed for importing a submission
+        path : list
+            sys.path of the parent, so submissions can be found in
+            workers that were not forked from it
+        isolate : int
+            number of tests of a submission run at once in forked copies
+            of it, 0 to run them in the worker itself
+        profile : dict
+            (suite, name) tasks to profile, with the file their cProfile
+            stats are written to
+        plans : list
+            TestPlan of every suite
+        events : multiprocessing.SimpleQueue
+            queue the worker reports the tasks it starts and finishes
+            grading on, None to not report them
+        quiet : bool
+            discard what the worker prints, e.g. the results of each
+            student
+    """
+
+    # Ctrl-C is left to the parent, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for entry in path :
+        if entry not in sys.path :
+            sys.path.append(entry)
+    _worker['suites'] = []
+    for test_module, test_class, submissions in suites :
+        tm = importlib.import_module(test_module)
+        if not isinstance(submissions, Submissions) :
+            submissions = Submissions(submissions)
+        _worker['suites'].append((getattr(tm, test_class), submissions))
+    hwimport.installFinder()
+    _worker['limits'] = limits
+    _worker['import_timeout'] = import_timeout
+    _worker['isolate'] = isolate
+    _worker['profile'] = profile or {}
+    _worker['plans'] = plans or [None]*len(suites)
+    _worker['events'] = events
+    if quiet :
+        # the runner's stream is bound to the original stderr, so the
+        # file descriptors are replaced rather than sys.stdout/stderr
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+
+def precheckTask(task) :
+    """
+    Prechecks submission 'name' of suite 'suite', given as a (suite, name)
+    pair, in a worker set up by initWorker. Returns (suite, name, errors,
+    warnings).
+    """
+
+    suite, name = task
+    filename, source = readSubmission(name, _worker['suites'][suite][1])
+    return (suite,) + hwprecheck.precheck(name, filename, source)
+
+def fingerprintTask(task) :
+    """
+    Fingerprints submission 'name' of suite 'suite', given as a (suite,
+    name, ignore) task, in a worker set up by initWorker, leaving out the
+    fingerprints in ignore. Returns (suite, name, fingerprints, signature).
+    """
+
+    suite, name, ignore = task
+    filename, source = readSubmission(name, _worker['suites'][suite][1])
+    if filename is None :
+        return suite, name, [], None
+    return (suite, name) + hwsimilarity.fingerprintFile(filename, ignore, source)
+
+def gradeTask(task) :
+    """
+    Grades submission 'name' of suite 'suite', given as a (suite, name)
+    pair, in a worker set up by initWorker, and returns (suite, data). A
+    (suite, name, tests) task only runs the named tests of the suite. The
+    submission is imported from the suite's Submissions under its cleaned
+    up name, and the suite's folder or zip file is searched first for the
+    modules it imports, so submissions of different assignments can share
+    a name. The submission, and any modules it imported from its own
+    folder, are dropped afterwards so they can't leak into the next
+    student graded by the same worker. Libraries stay imported to keep the
+    worker warm.
+    """
+
+    suite, name = task[:2]
+    tests = task[2] if len(task) > 2 else None
+    test_class, submissions = _worker['suites'][suite]
+    modules = set(sys.modules)
+    events = _worker.get('events')
+    if events is not None :
+        events.put(('start', os.getpid(), task, time.time()))
+    # files may have been added to the folder since the last import
+    submissions.refresh()
+    hwimport.finder.sources.insert(0, submissions)
+    sys.path.insert(0, submissions.location)
+    importlib.invalidate_caches()
+    # helper modules the submission imports leave no __pycache__ behind
+    write_bytecode = sys.dont_write_bytecode
+    sys.dont_write_bytecode = True
+    try :
+        return suite, runTests(name, test_class, _worker['limits'],
+                               _worker['import_timeout'], _worker['isolate'],
+                               _worker['profile'].get((suite, name)), tests,
+                               _worker['plans'][suite])
+    finally :
+        if events is not None :
+            events.put(('done', os.getpid(), task, time.time()))
+        sys.dont_write_bytecode = write_bytecode
+        sys.path.remove(submissions.location)
+        hwimport.finder.sources.remove(submissions)
+        student = sys.modules.get(name)
+        folder = os.path.dirname(getattr(student, '__file__', None) or '')
+        for module in set(sys.modules) - modules :
+            filename = getattr(sys.modules[module], '__file__', None) or ''
+            if module == name or (folder and os.path.dirname(filename) == folder) :
+                del sys.modules[module]
+
+def gradeChunk(tasks) :
+    """Grades the tasks one after the other with gradeTask and returns the
+    list of their results"""
+    return [gradeTask(task) for task in tasks]
+
+def processAlive(pid) :
+    """Checks whether process pid still exists, always True where that
+    can't be checked"""
+    if platform in ['win32', 'win64'] :
+        # os.kill would terminate it
+        return True
+    try :
+        os.kill(pid, 0)
+    except ProcessLookupError :
+        return False
+    except OSError :
+        pass
+    return True
+
+def crashedResult() :
+    """Returns the data of a submission whose worker died while grading
+    it, e.g. killed for using too much memory or by a crash in a C
+    extension"""
+    return {'total': 0, 'percent': 0, 'status': 'resource',
+            'comment': 'Grading stopped because the process running the tests died.'}
+
+def shardTasks(tasks, plans, processes, size=0, keep=()) :
+    """
+    Splits the tests of submissions into shards that are graded as
+    separate tasks, so a few students with long test classes don't leave
+    workers idle
+
+    Arguments :
+        tasks : list
+            (suite, name) tasks to be graded
+        plans : list
+            TestPlan of each suite
+        processes : int
+            number of worker processes
+        size : int
+            number of tests in a shard, 0 to only split submissions when
+            there are fewer of them than workers, into enough shards for
+            every worker to get one
+        keep : set
+            tasks that are graded whole, but still count towards the
+            number of submissions
+
+    Returns :
+        shards : dict
+            (suite, name)/list of shard pairs, where a shard is a tuple of
+            test names, for the tasks that are split. A test is always in
+            the same shard as the tests it requires.
+    """
+
+    shards = {}
+    if not tasks or (not size and len(tasks) >= processes) :
+        return shards
+    count = math.ceil(processes/len(tasks))
+    splits = {}
+    for suite, name in tasks :
+        if (suite, name) in keep :
+            continue
+        if suite not in splits :
+            splits[suite] = splitPlan(plans[suite], size or math.ceil(len(plans[suite].names)/count))
+        if len(splits[suite]) > 1 :
+            shards[(suite, name)] = splits[suite]
+    return shards
+
+def splitPlan(plan, size) :
+    """
+    Splits the tests of a plan into shards of about size tests, only
+    between tests where no later test requires an earlier one
+    """
+
+    names = plan.names
+    index = {name: i for i, name in enumerate(names)}
+    # reach[i] is the first test required by any test from i on
+    reach = [len(names)]*(len(names) + 1)
+    for i in range(len(names) - 1, -1, -1) :
+        required = [index[test] for test in plan.tests[names[i]]['requires'] if test in index]
+        reach[i] = min([reach[i + 1], i] + required)
+    shards = []
+    start = 0
+    for i in range(1, len(names)) :
+        if i - start >= size and reach[i] >= i :
+            shards.append(tuple(names[start:i]))
+            start = i
+    shards.append(tuple(names[start:]))
+    return shards
+
+def mergeResults(parts, order) :
+    """
+    Merges the data of a submission graded in shards into the data of one
+    run of all of its tests
+
+    Arguments :
+        parts : list
+            data of each shard of the submission
+        order : list
+            names of the tests in the order they run
+    """
+
+    for part in parts :
+        if 'tests' not in part :
+            # importing fails the same way in every shard
+            return part
+    tests = {}
+    for part in parts :
+        tests.update(part['tests'])
+    data = {'tests': {test: tests[test] for test in order if test in tests}}
+    data['score'] = sum(entry['points'] for entry in data['tests'].values()
+                        if entry['status'] == 'pass')
+    data['total'] = sum(entry['points'] for entry in data['tests'].values())
+    data['percent'] = 100*data['score']/data['total']
+    # every shard imports the submission, the tests add up, and the
+    # shards run side by side, so the slowest one took the wall time
+    data['timings'] = {'import': max(part['timings']['import'] for part in parts),
+                       'tests': sum(part['timings'].get('tests', 0) for part in parts),
+                       'total': max(part['timings']['total'] for part in parts)}
+    if all('peak_memory' in part for part in parts) :
+        data['peak_memory'] = max(part['peak_memory'] for part in parts)
+    outputs = [part['output'] for part in parts if 'output' in part]
+    if outputs :
+        data['output'] = outputs[0]
+    return data
+
+class GradingEngine:
+    """
+    Pool of warm grading workers. Each worker imports the test modules and
+    their dependencies once when it starts, rather than receiving a pickled
+    test class with every submission. Several suites of tests, e.g. the
+    tests of different assignments, can share the pool.
+
+    Arguments :
+        suites : list
+            (test module, test class, submissions) of every suite of tests,
+            see initWorker, tasks refer to a suite by its index in this
+            list
+        processes : int
+            number of worker processes
+        limits : dict
+            default budgets for each test
+        import_timeout : float
+            seconds allowed for importing a submission
+        start_method : str
+            multiprocessing start method, None for the platform default.
+            With 'fork' the workers inherit the modules already imported by
+            the parent, with 'forkserver' the server preloads them once.
+        recycle : int
+            replace a worker after it has graded this many tasks, 0 to keep
+            workers for the whole run
+        isolate : int
+            number of tests of a submission run at once in forked copies
+            of it, 0 to run them in the worker itself
+        profile : dict
+            (suite, name) tasks to profile, with the file their cProfile
+            stats are written to
+        plans : list
+            TestPlan of every suite, compiled here when not given
+        events : bool
+            pass on the reports of the submissions workers start and finish
+            grading to the queue self.events, see hwprogress
+        quiet : bool
+            discard what the workers print
+    """
+
+    def __init__(self, suites, processes=4, limits=None, import_timeout=10,
+                 start_method=None, recycle=0, isolate=0, profile=None, plans=None,
+                 events=False, quiet=False) :
+        if plans is None :
+            plans = [TestPlan(getattr(importlib.import_module(test_module), test_class), limits)
+                     for test_module, test_class, submissions in suites]
+        self.plans = plans
+        ctx = mp.get_context(start_method)
+        # workers always report the tasks they start and finish, so tasks
+        # lost with a worker that died can be found, see grade
+        self.reports = ctx.SimpleQueue()
+        self.events = queue.Queue() if events else None
+        self.abandoned = False
+        if ctx.get_start_method() == 'forkserver' :
+            ctx.set_forkserver_preload(['__main__'] + [suite[0] for suite in suites])
+        self.pool = ctx.Pool(processes=processes, initializer=initWorker,
+                             initargs=(list(suites), limits or {}, import_timeout,
+                                       list(sys.path), isolate, profile, plans,
+                                       self.reports, quiet),
+                             maxtasksperchild=recycle or None)
+
+    def precheck(self, tasks, chunksize=1) :
+        """Returns an iterator over (suite, name, problems) from compiling
+        and scanning the (suite, name) tasks in the workers, in the order
+        they are finished"""
+        return self.pool.imap_unordered(precheckTask, tasks, chunksize)
+
+    def fingerprint(self, tasks, chunksize=1) :
+        """Returns an iterator over (suite, name, fingerprints, signature)
+        from fingerprinting the (suite, name, ignore) tasks in the workers,
+        in the order they are finished"""
+        return self.pool.imap_unordered(fingerprintTask, tasks, chunksize)
+
+    def grade(self, tasks, chunksize=1, shards=None) :
+        """Returns an iterator over (suite, data) results of the (suite,
+        name) tasks, in the order they are finished. Tasks in shards, see
+        shardTasks, are graded a shard at a time, and their data is merged
+        once every shard is done. When a worker dies while grading, e.g.
+        killed for using too much memory or by a crash in a C extension,
+        the submission it was on gets crashedResult and the other tasks of
+        its chunk are graded again, rather than the run waiting forever for
+        them."""
+        shards = shards or {}
+        expanded = []
+        for task in tasks :
+            if task in shards :
+                expanded += [task + (tests,) for tests in shards[task]]
+            else :
+                expanded.append(task)
+        results = queue.Queue()
+        chunks = {}     # id/tasks of the chunks whose results are due
+        chunkOf = {}    # task/id of the chunk it was last sent in
+        owners = {}     # chunk id/pid of the worker grading it
+        running = {}    # pid/task the worker started and didn't finish
+        dead = {}       # chunk id/time its worker was first found dead
+        ids = iter(range(sys.maxsize))
+
+        def submit(chunk) :
+            i = next(ids)
+            chunks[i] = chunk
+            for task in chunk :
+                chunkOf[task] = i
+            self.pool.apply_async(gradeChunk, (chunk,),
+                                  callback=lambda value : results.put((i, value, None)),
+                                  error_callback=lambda error : results.put((i, None, error)))
+
+        def read() :
+            while not self.reports.empty() :
+                event, pid, task, when = self.reports.get()
+                if event == 'start' :
+                    running[pid] = task
+                    if chunkOf.get(task) in chunks :
+                        owners[chunkOf[task]] = pid
+                else :
+                    running.pop(pid, None)
+                if self.events is not None :
+                    self.events.put((event, pid, task[1], when))
+
+        parts = {}
+        def merge(suite, data) :
+            for name, result in data.items() :
+                task = (suite, name)
+                if task not in shards :
+                    yield suite, {name: result}
+                    continue
+                parts.setdefault(task, []).append(result)
+                if len(parts[task]) == len(shards[task]) :
+                    order = [test for shard in shards[task] for test in shard]
+                    yield suite, {name: mergeResults(parts.pop(task), order)}
+
+        for start in range(0, len(expanded), chunksize) :
+            submit(expanded[start:start + chunksize])
+        checked = time.time()
+        while chunks :
+            try :
+                i, value, error = results.get(timeout=0.2)
+            except queue.Empty :
+                i = None
+            read()
+            if i in chunks :
+                del chunks[i]
+                owners.pop(i, None)
+                dead.pop(i, None)
+                if error is not None :
+                    raise error
+                for suite, data in value :
+                    yield from merge(suite, data)
+            if time.time() - checked < 0.2 :
+                continue
+            checked = time.time()
+            for i, pid in list(owners.items()) :
+                if processAlive(pid) :
+                    continue
+                # the worker may have sent the results just before it was
+                # recycled, so they get a moment to arrive
+                if checked - dead.setdefault(i, checked) < 1 :
+                    continue
+                # everything it reported before it died is in the queue
+                read()
+                self.abandoned = True
+                chunk = chunks.pop(i)
+                del owners[i], dead[i]
+                task = running.pop(pid, None)
+                if task is not None and self.events is not None :
+                    self.events.put(('done', pid, task[1], checked))
+                if task is not None and chunkOf.get(task) == i :
+                    print('Worker died while grading ' + task[1])
+                    yield from merge(task[0], {task[1]: crashedResult()})
+                rest = [other for other in chunk if other != task]
+                if rest :
+                    submit(rest)
+
+    def close(self) :
+        if self.abandoned :
+            # the pool waits for the results of lost tasks forever
+            self.pool.terminate()
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, type, value, traceback) :
+        if type is not None :
+            # e.g. Ctrl-C, don't wait for the submissions still queued
+            self.pool.terminate()
+        self.close()
@@ -0,0 +1,112 @@
+"""
+Canvas gradebook updates. The gradebook csv is read and written in a single
+streaming pass, with the scores of any number of assignments looked up by
+SIS User ID, and the new file replaces the old one atomically.
+"""
+
+import os
+import re
+import csv
+import shutil
+import tempfile
+
+# columns identifying the student that Canvas needs in an import
+ID_COLUMNS = 5
+
+
+def assignmentColumns(headers, assignments) :
+    """Returns a dictionary of assignment/column index pairs
+
+    Args:
+        headers - header row of the gradebook
+        assignments - names of the assignments in canvas, which canvas
+                      follows with the assignment id, e.g. 'HW 1 (477881)'
+    """
+    columns = {}
+    for assignment in assignments :
+        pattern = re.compile(assignment + r' \(\d+\)')
+        matches = [i for i, header in enumerate(headers) if pattern.match(header)]
+        if not matches :
+            raise ValueError('assignment ' + assignment + ' is not in the gradebook')
+        columns[assignment] = matches[0]
+    return columns
+
+def studentScores(studentID, data) :
+    """Returns a dictionary of SIS User ID/percent pairs for one assignment
+
+    Args:
+        studentID - dictionary of student ID/name pairs
+        data - dictionary of name/test result pairs
+    """
+    return {sis_id: data[name]['percent'] for sis_id, name in studentID.items() if name in data}
+
+def studentSections(grades_file) :
+    """Returns a dictionary of SIS User ID/section pairs from the gradebook,
+    empty if it has no Section column
+
+    Args:
+        grades_file - name of csv file of gradebook downloaded from canvas
+    """
+    sections = {}
+    with open(grades_file, newline='') as f :
+        rows = csv.reader(f)
+        headers = next(rows, [])
+        if 'Section' not in headers or 'SIS User ID' not in headers :
+            return sections
+        sis_column = headers.index('SIS User ID')
+        section_column = headers.index('Section')
+        for row in rows :
+            # the muted and points rows have no SIS User ID
+            if len(row) > max(sis_column, section_column) and row[sis_column] :
+                sections[row[sis_column]] = row[section_column]
+    return sections
+
+def updateGrades(grades_file, scores) :
+    """Updates the grades csv with the scores from testing. The csv keeps
+    the student columns and one column per graded assignment, which is what
+    canvas expects to import, and the graded assignments are muted for
+    review on upload.
+
+    Args:
+        grades_file - name of csv file of gradebook downloaded from canvas
+        scores - dictionary of assignment/scores pairs, where scores is a
+                 dictionary of SIS User ID/percent pairs
+    """
+
+    directory = os.path.dirname(os.path.abspath(grades_file))
+    with open(grades_file, newline='') as fin, \
+         tempfile.NamedTemporaryFile('w', newline='', dir=directory, suffix='.csv',
+                                     delete=False) as fout :
+        csvfilein = csv.reader(fin)
+        csvfileout = csv.writer(fout)
+        try :
+            #gets header and the index of every assignment being updated
+            headers = next(csvfilein)
+            sis_column = headers.index('SIS User ID')
+            columns = assignmentColumns(headers, scores)
+            indices = list(columns.values())
+            csvfileout.writerow(headers[:ID_COLUMNS] + [headers[i] for i in indices])
+
+            #next line is whether assignment is muted or not
+            muted = next(csvfilein)
+            csvfileout.writerow(muted[:ID_COLUMNS] + ['Muted' for i in indices])
+
+            #next line is points for an assignment
+            points = next(csvfilein)
+            assignment_points = {assignment: float(points[i]) for assignment, i in columns.items()}
+            csvfileout.writerow(points[:ID_COLUMNS] + [points[i] for i in indices])
+
+            for row in csvfilein :
+                sis_id = row[sis_column]
+                for assignment, i in columns.items() :
+                    if sis_id in scores[assignment] :
+                        row[i] = scores[assignment][sis_id]*assignment_points[assignment]/100
+                    else :
+                        print(row[0] + ' had no submission for ' + assignment + '.')
+                csvfileout.writerow(row[:ID_COLUMNS] + [row[i] for i in indices])
+        except BaseException :
+            fout.close()
+            os.remove(fout.name)
+            raise
+    shutil.copymode(grades_file, fout.name)
+    os.replace(fout.name, grades_file)
@@ -0,0 +1,307 @@
+"""
+Imports submissions straight from where they were submitted. A folder or a
+Canvas zip download holds the files under the names students gave them,
+which are often not valid module names. Submissions maps each file to the
+cleaned up module name it is graded as, and a finder on sys.meta_path loads
+that module from the original file or zip member, so nothing is extracted,
+copied, renamed or compiled into the submissions folder. The bytecode the
+precheck compiles is kept outside of it, keyed by a hash of the source, and
+reused by the import.
+"""
+
+import os
+import re
+import sys
+import marshal
+import hashlib
+import zipfile
+import tempfile
+import importlib.abc
+import importlib.util
+
+# bytecode of submissions compiled by the precheck, see storeBytecode
+bytecode_dir = '.bytecode_cache'
+
+
+def cleanup_filename(filename) :
+    """Checks files for characters that make the file unable to be imported
+    as a module and removes those characters from the filename so tests can
+    be run"""
+    original = filename
+    change = ''
+    if re.search("-\d+", filename) :
+        #Gets rid of canvas added -\d at end of file
+        filename = re.sub("-\d+", "", filename)
+    if '-' in filename :
+        # Gets rid of dashes
+        filename = filename.replace('-','_')
+        change += '-'
+    if '#' in filename :
+        # Gets rid of pound sign (some students put 'hw#4' in their name)
+        filename = filename.replace('#','')
+        change += '#'
+    if '+' in filename :
+        # Gets rid of pound sign (some students put 'hw#4' in their name)
+        filename = filename.replace('+','')
+        change += '+'
+    if ' ' in filename :
+        # Gets rid of pound sign (some students put 'hw#4' in their name)
+        filename = filename.replace(' ','_')
+        change += ' '
+    if '.' in filename[:-3] :
+        # Swithches periods to underscores since some students use them in
+        # place of them. Does not replace the '.' in '.py'
+        filename = filename[:-3].replace('.', '_') + filename[-3:]
+        change += '.'
+    return filename, original, change
+
+def matchSubmission(filename, pattern, exclude) :
+    """Matches a file in the submissions directory against the pattern.
+
+    Args:
+        filename - name of the file as submitted
+        pattern - regex pattern that matches submissions
+        exclude - regex pattern that matches files not to be included
+    Returns:
+        None if the file is not a submission, otherwise a tuple of
+        newname - file name the submission is tested as
+        original - file name as submitted
+        change - string of the bad symbols removed from the file name
+        sis_id - student ID from the file name
+    """
+
+    # First, clean up the filename by removing bad symbols.  This
+    # assumes that submissions won't have weird prefixes placed on them
+    # by Canvas that inject other symbols.  Maybe there is a way to
+    # get the files as named upon submission?
+    filename, original, change = cleanup_filename(filename)
+
+    # If the filename as cleaned is not excluded, check if it matches
+    # the pattern given by the caller.
+    if re.search(exclude, filename) or not re.search(pattern, filename) :
+        return None
+    newname = re.search(pattern, filename).group()
+    if not re.search('late', filename) :
+        sis_id = filename.split('_')[1]
+    else :
+        sis_id = filename.split('_')[2]
+    return newname, original, change, sis_id
+
+class Submissions:
+    """
+    Folder or zip file of submissions and the module name each one is
+    imported as. Without a pattern every .py file whose name is a valid
+    module name is a submission of that name.
+
+    Arguments :
+        location : str
+            path of the folder, or of a zip file such as a Canvas download
+        pattern : str
+            regex pattern that matches submissions, see matchSubmission
+        exclude : str
+            regex pattern that matches files not to be included
+    """
+
+    def __init__(self, location, pattern=None, exclude=None) :
+        self.location = location
+        self.pattern = pattern
+        self.exclude = exclude
+        self.archive = zipfile.is_zipfile(location) if os.path.isfile(location) else False
+        # module name/file or zip member pairs, as of the last scan
+        self.modules = {}
+        self.stamp = None
+        # open zip file, its member name/ZipInfo pairs, and the process and
+        # modification time it was opened at
+        self.zip = None
+        self.members = {}
+        self.opened = None
+
+    def listing(self) :
+        """Returns a dictionary of file or zip member/(modification time,
+        size) pairs of the submissions"""
+        if self.archive :
+            self.open()
+            return {member: (info.date_time, info.file_size)
+                    for member, info in self.members.items() if not info.is_dir()}
+        return {entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in os.scandir(self.location) if entry.is_file()}
+
+    def match(self, member) :
+        """Returns the matchSubmission tuple of a file or zip member, or
+        None if it is not a submission"""
+        filename = os.path.basename(member)
+        if self.pattern is not None :
+            return matchSubmission(filename, self.pattern, self.exclude)
+        name, extension = os.path.splitext(filename)
+        if extension != '.py' or not name.isidentifier() :
+            return None
+        return filename, filename, '', None
+
+    def submissions(self, listing=None) :
+        """Returns (member, match) of every submission, oldest first, so
+        when resubmissions clean up to the same name the latest wins"""
+        listing = self.listing() if listing is None else listing
+        found = []
+        for member in sorted(listing, key=lambda member: (listing[member], member)) :
+            match = self.match(member)
+            if match is not None :
+                found.append((member, match))
+        return found
+
+    def scan(self) :
+        """Maps every submission to the module name it is imported as"""
+        self.stamp = self.modified()
+        self.modules = {match[0][:-3]: member for member, match in self.submissions()}
+
+    def modified(self) :
+        """Returns the modification time of the folder or zip file, which
+        changes when files are added to or removed from it"""
+        try :
+            return os.stat(self.location).st_mtime_ns
+        except OSError :
+            return None
+
+    def refresh(self) :
+        """Scans again if files were added or removed since the last scan"""
+        if self.stamp is None or self.modified() != self.stamp :
+            self.scan()
+
+    def open(self) :
+        """Opens the zip file, once per process, and again when it has
+        changed, so each read doesn't parse its central directory again"""
+        # a forked worker shares the file offset of its parent's file, so
+        # it opens its own
+        opened = (os.getpid(), self.modified())
+        if self.zip is None or self.opened != opened :
+            if self.zip is not None :
+                self.zip.close()
+            self.zip = zipfile.ZipFile(self.location)
+            self.members = {info.filename: info for info in self.zip.infolist()}
+            self.opened = opened
+
+    def path(self, member) :
+        """Returns the path shown for a file or zip member in tracebacks"""
+        return os.path.join(self.location, member)
+
+    def read(self, member) :
+        """Returns the bytes of a file or zip member"""
+        if self.archive :
+            self.open()
+            return self.zip.read(self.members[member])
+        with open(self.path(member), 'rb') as f :
+            return f.read()
+
+    def __getstate__(self) :
+        # workers scan for themselves, the listing may be stale by then
+        state = dict(self.__dict__)
+        state['modules'] = {}
+        state['stamp'] = None
+        state['zip'] = None
+        state['members'] = {}
+        state['opened'] = None
+        return state
+
+def readSubmission(name, submissions=None) :
+    """
+    Returns (path, source bytes) of submission 'name', looked up in
+    submissions first and then through sys.path, or (None, None) if it
+    can't be found
+    """
+
+    if submissions is not None :
+        submissions.refresh()
+        member = submissions.modules.get(name)
+        if member is not None :
+            return submissions.path(member), submissions.read(member)
+    spec = importlib.util.find_spec(name)
+    if spec is None or not spec.has_location :
+        return None, None
+    with open(spec.origin, 'rb') as f :
+        return spec.origin, f.read()
+
+def bytecodeFile(path, source) :
+    """Returns the file the bytecode of the submission source at path is
+    kept in, under sys.pycache_prefix when it is set"""
+    directory = bytecode_dir
+    if sys.pycache_prefix :
+        directory = os.path.join(sys.pycache_prefix, 'submissions')
+    digest = hashlib.sha256(path.encode() + b'\0' + source).hexdigest()
+    return os.path.join(directory, '{}.{}.pyc'.format(digest, sys.implementation.cache_tag))
+
+def storeBytecode(path, source, code) :
+    """Keeps the code compiled from the submission source at path, so the
+    import doesn't compile it again"""
+    filename = bytecodeFile(path, source)
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    # written to a temporary file first, so a worker importing the
+    # submission at the same time never reads a partly written file
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.pyc', delete=False) as f :
+        f.write(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+    os.replace(f.name, filename)
+
+def loadBytecode(path, source) :
+    """Returns the code kept by storeBytecode for the submission source at
+    path, or None if there is none"""
+    try :
+        with open(bytecodeFile(path, source), 'rb') as f :
+            data = f.read()
+    except OSError :
+        return None
+    magic = importlib.util.MAGIC_NUMBER
+    if not data.startswith(magic) :
+        return None
+    try :
+        return marshal.loads(data[len(magic):])
+    except (EOFError, ValueError, TypeError) :
+        return None
+
+class SubmissionLoader(importlib.abc.SourceLoader):
+    """Loads a submission from its file or zip member. It has no path_stats,
+    so no bytecode is cached next to the submission, the code the precheck
+    kept with storeBytecode is used instead."""
+
+    def __init__(self, submissions, member) :
+        self.submissions = submissions
+        self.member = member
+
+    def get_filename(self, fullname) :
+        return self.submissions.path(self.member)
+
+    def get_data(self, path) :
+        return self.submissions.read(self.member)
+
+    def get_code(self, fullname) :
+        path = self.get_filename(fullname)
+        source = self.get_data(path)
+        code = loadBytecode(path, source)
+        if code is None :
+            # not prechecked, e.g. with --no_precheck
+            code = self.source_to_code(source, path)
+        return code
+
+class SubmissionFinder(importlib.abc.MetaPathFinder):
+    """Finds the modules of the Submissions in self.sources, ahead of the
+    rest of sys.meta_path"""
+
+    def __init__(self) :
+        self.sources = []
+
+    def find_spec(self, fullname, path=None, target=None) :
+        if path is not None :
+            # submissions are top level modules
+            return None
+        for submissions in self.sources :
+            member = submissions.modules.get(fullname)
+            if member is not None :
+                loader = SubmissionLoader(submissions, member)
+                return importlib.util.spec_from_file_location(
+                    fullname, submissions.path(member), loader=loader)
+        return None
+
+finder = SubmissionFinder()
+
+def installFinder() :
+    """Puts the finder first on sys.meta_path, once"""
+    if finder not in sys.meta_path :
+        sys.meta_path.insert(0, finder)
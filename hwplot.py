@@ -0,0 +1,54 @@
+"""
+Plots of the grading statistics. Imported only when a plot is requested,
+since numpy and matplotlib are slow to load.
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+def plotStats(matrix, filename='stats_plot.png') :
+    """
+    Creates a stacked bar plot to visualize performance on each test
+    
+    Arguments :
+        matrix : hwstats.ResultMatrix
+            results of the run
+        filename : str
+            path of the png file the plot is saved to
+            
+    Creates :
+        stats_plot.png : .png file
+            graphic representation of performance by test
+    """
+    
+    # tests x statuses, in percent of the students that ran each test
+    rates = matrix.rates()
+    lefts = np.cumsum(rates, axis=1) - rates
+    
+    # Graph formatting
+    ind = np.arange(0, len(matrix.tests)*2, 2)
+    width = 0.25
+    colors = [(0.41, 1.0, 0.62), (1.0, 0.5, 0.62), (0.2588,0.4433,1.0), (1.0, 0.8, 0.3),
+              (0.6, 0.6, 0.6), (0.85, 0.85, 0.85)]
+    
+    # Plotting
+    plt.figure(figsize=(10,6), edgecolor='w')    
+    bars = [plt.barh(ind, rates[:, k], width, color=colors[k], left=lefts[:, k])
+            for k in range(rates.shape[1])]
+    
+    # Label and title
+    plt.xlabel('Percent')
+    plt.title('Grading Statistics', loc='left')
+    
+    # axis ticks and legend and layout
+    plt.yticks(ind, matrix.tests, rotation='horizontal')
+    plt.xticks(np.arange(0,101, 10), rotation='horizontal')
+    plt.legend([bar[0] for bar in bars],
+               ('Passes', 'Failures', 'Errors', 'Timeouts', 'Over limit', 'Skipped'),
+               bbox_to_anchor=(1,1.06), loc='upper right', ncol=6, borderaxespad=0.)
+    plt.tight_layout()
+    
+    # saves figure
+    plt.savefig(filename)
+    plt.close()
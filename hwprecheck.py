@@ -0,0 +1,165 @@
+"""
+Static precheck of submissions before they are tested. Each file is parsed
+and compiled once, files that can't be compiled are rejected with the
+compiler's own message, and the module level code is scanned for constructs
+that are likely to hang or stall a worker when the module is imported.
+Those are reported as warnings, which reject the file too unless flagged
+files are graded anyway, since the scan can't tell for sure what the code
+does. The bytecode
+of files found through sys.path is written to __pycache__, and that of
+submissions read by hwimport is kept by hwimport.storeBytecode, so the
+import reuses it either way.
+"""
+
+import ast
+import importlib.util
+import py_compile
+import hwimport
+
+# longest str/bytes literal and largest list/set/dict display allowed
+MAX_LITERAL = 10**6
+MAX_DISPLAY = 10**5
+
+
+class ModuleScanner(ast.NodeVisitor):
+    """
+    Collects problems in the code that runs when a module is imported.
+    Function bodies and the body of an if __name__ == '__main__' guard are
+    skipped, since they only run when tests call them, and are then covered
+    by the test budgets, or when the file is run as a script.
+    """
+
+    def __init__(self):
+        self.problems = []
+
+    def report(self, node, message):
+        self.problems.append('{} on line {}'.format(message, node.lineno))
+
+    def visit_FunctionDef(self, node):
+        pass
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_Lambda = visit_FunctionDef
+
+    def visit_If(self, node):
+        if isMainGuard(node.test) :
+            for child in node.orelse :
+                self.visit(child)
+        else :
+            self.generic_visit(node)
+
+    def visit_While(self, node):
+        if isinstance(node.test, ast.Constant) and node.test.value and not hasBreak(node.body) :
+            self.report(node, 'Module level while loop that never ends')
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id == 'input' :
+            self.report(node, 'Module level call to input()')
+        self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, (str, bytes)) and len(node.value) > MAX_LITERAL :
+            self.report(node, 'Literal of {} characters'.format(len(node.value)))
+
+    def visit_List(self, node):
+        if len(node.elts) > MAX_DISPLAY :
+            self.report(node, 'Literal of {} elements'.format(len(node.elts)))
+        else :
+            self.generic_visit(node)
+
+    visit_Tuple = visit_List
+    visit_Set = visit_List
+
+    def visit_Dict(self, node):
+        if len(node.keys) > MAX_DISPLAY :
+            self.report(node, 'Literal of {} elements'.format(len(node.keys)))
+        else :
+            self.generic_visit(node)
+
+def isMainGuard(test):
+    """Checks whether an if test is __name__ == '__main__', either way round"""
+    if not (isinstance(test, ast.Compare) and len(test.ops) == 1
+            and isinstance(test.ops[0], ast.Eq)) :
+        return False
+    sides = [test.left, test.comparators[0]]
+    return (any(isinstance(side, ast.Name) and side.id == '__name__' for side in sides)
+            and any(isinstance(side, ast.Constant) and side.value == '__main__' for side in sides))
+
+def hasBreak(body):
+    """Checks whether the statements of a loop body can leave the loop"""
+    for node in body :
+        if isinstance(node, (ast.Break, ast.Raise)) :
+            return True
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) :
+            continue
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)) :
+            # a break in a nested loop only leaves that loop, unless it is
+            # in the loop's else clause
+            if hasBreak(node.orelse) :
+                return True
+            continue
+        if hasBreak(ast.iter_child_nodes(node)) :
+            return True
+    return False
+
+def precheck(name, filename=None, source=None):
+    """
+    Compiles the source of module 'name' and scans it for problems
+
+    Arguments :
+        name : str
+            name of the module to check
+        filename : str
+            path of its source, None to find the module through sys.path
+        source : bytes
+            the source itself, None to read it from filename
+
+    Returns :
+        name : str
+            the name of the module
+        errors : list
+            str describing why the module can't be compiled, empty if it
+            can, the module is then not worth testing
+        warnings : list
+            str describing each construct that may stall the import, empty
+            if the module is clean, the module is then best not tested
+            either
+    """
+
+    if filename is None :
+        spec = importlib.util.find_spec(name)
+        if spec is not None and spec.has_location :
+            filename = spec.origin
+    if filename is None :
+        return name, ['Submission could not be found'], []
+    found = source is None
+    if source is None :
+        with open(filename, 'rb') as f :
+            source = f.read()
+    try :
+        tree = ast.parse(source, filename)
+        # some errors, e.g. a return outside of a function, are only found
+        # by the compiler
+        code = compile(tree, filename, 'exec', dont_inherit=True)
+    except SyntaxError as err :
+        return name, ['{}: {} on line {}'.format(type(err).__name__, err.msg, err.lineno)], []
+    except ValueError as err :
+        # e.g. null bytes in the source
+        return name, ['Source could not be compiled: {}'.format(err)], []
+    scanner = ModuleScanner()
+    scanner.visit(tree)
+    # the import compiles it again if the bytecode can't be written, which
+    # is only slower
+    if found :
+        try :
+            py_compile.compile(filename, cfile=importlib.util.cache_from_source(filename),
+                               doraise=True)
+        except (py_compile.PyCompileError, OSError) :
+            pass
+    else :
+        try :
+            hwimport.storeBytecode(filename, source, code)
+        except OSError :
+            pass
+    return name, [], scanner.problems
@@ -0,0 +1,189 @@
+"""
+Live progress of a grading run. Workers report the submission they start
+and finish on a queue, the parent counts the results as they come in, and a
+background thread refreshes a progress line on the terminal and a metrics
+file that can be watched from outside the run.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import tempfile
+import threading
+
+
+class Progress:
+    """
+    Tracks a run of 'total' submissions.
+
+    Arguments :
+        total : int
+            number of submissions in the run, including cached ones
+        cached : int
+            number of those whose results came from the cache, they count as
+            completed but not towards the rate
+        stream : file
+            where the progress line is shown, None to not show it
+        metrics_file : str
+            file the metrics are written to, in the Prometheus text format
+            if it ends in .prom and as JSON otherwise, None for no file
+        interval : float
+            seconds between refreshes
+    """
+
+    def __init__(self, total, stream=None, metrics_file=None, interval=2, cached=0) :
+        self.total = total
+        self.cached = cached
+        self.stream = stream
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.started = time.time()
+        self.completed = cached
+        self.statuses = {}
+        self.workers = {}
+        self.events = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.refresh, daemon=True)
+        self.thread.start()
+
+    def attach(self, events) :
+        """Starts reading the (event, pid, name, time) reports of workers
+        from the queue events"""
+        self.events = events
+
+    def done(self, name, result) :
+        """Counts the result data of submission 'name'"""
+        with self.lock :
+            self.completed += 1
+            if 'tests' in result :
+                for test in result['tests'].values() :
+                    self.statuses[test['status']] = self.statuses.get(test['status'], 0) + 1
+            else :
+                # rejected by the precheck or failed to import
+                self.statuses['untested'] = self.statuses.get('untested', 0) + 1
+
+    def read(self) :
+        """Applies the reports waiting on the events queue"""
+        while self.events is not None :
+            try :
+                event, pid, name, when = self.events.get_nowait()
+            except (queue.Empty, OSError, ValueError) :
+                return
+            with self.lock :
+                if event == 'start' :
+                    self.workers[pid] = (name, when)
+                else :
+                    self.workers.pop(pid, None)
+
+    def metrics(self) :
+        """Returns a dictionary of the metrics of the run so far"""
+        self.read()
+        now = time.time()
+        with self.lock :
+            elapsed = now - self.started
+            rate = (self.completed - self.cached)/elapsed if elapsed > 0 else 0
+            remaining = self.total - self.completed
+            return {
+                'total': self.total,
+                'completed': self.completed,
+                'cached': self.cached,
+                'elapsed_seconds': elapsed,
+                'submissions_per_second': rate,
+                'eta_seconds': remaining/rate if rate else None,
+                'statuses': dict(self.statuses),
+                'workers': {str(pid): {'student': name, 'elapsed_seconds': now - when}
+                            for pid, (name, when) in sorted(self.workers.items())},
+            }
+
+    def refresh(self) :
+        """Updates every interval seconds until the run is closed"""
+        while not self.stopped.wait(self.interval) :
+            self.update()
+
+    def update(self, final=False) :
+        """Shows the progress line and writes the metrics file"""
+        metrics = self.metrics()
+        if self.stream is not None :
+            line = formatProgress(metrics)
+            if self.stream.isatty() and not final :
+                width = terminalWidth()
+                self.stream.write('\r' + line[:width - 1].ljust(width - 1))
+            else :
+                self.stream.write(('\r' if self.stream.isatty() else '') + line + '\n')
+            self.stream.flush()
+        if self.metrics_file :
+            if self.metrics_file.endswith('.prom') :
+                text = formatPrometheus(metrics)
+            else :
+                text = json.dumps(metrics, indent=2) + '\n'
+            # replaced atomically so readers never see a partial file
+            directory = os.path.dirname(os.path.abspath(self.metrics_file))
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f :
+                f.write(text)
+            os.replace(f.name, self.metrics_file)
+
+    def close(self) :
+        """Stops refreshing and shows the final progress"""
+        self.stopped.set()
+        self.thread.join()
+        self.update(final=True)
+
+def terminalWidth() :
+    """Returns the width of the terminal"""
+    try :
+        return os.get_terminal_size(sys.stderr.fileno()).columns
+    except (OSError, ValueError) :
+        return 120
+
+def formatDuration(seconds) :
+    """Returns seconds as h:mm:ss"""
+    if seconds is None :
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+def formatProgress(metrics) :
+    """Returns the one line summary of the metrics shown on the terminal"""
+    percent = 100*metrics['completed']/metrics['total'] if metrics['total'] else 100
+    statuses = metrics['statuses']
+    line = 'Done {}/{} ({:.0f}%) {:.1f}/s ETA {} | timeouts {} errors {} untested {}'.format(
+        metrics['completed'], metrics['total'], percent, metrics['submissions_per_second'],
+        formatDuration(metrics['eta_seconds']), statuses.get('timeout', 0),
+        statuses.get('error', 0), statuses.get('untested', 0))
+    workers = ['{} {:.0f}s'.format(worker['student'], worker['elapsed_seconds'])
+               for worker in metrics['workers'].values()]
+    if workers :
+        line += ' | ' + ', '.join(workers)
+    return line
+
+def formatPrometheus(metrics) :
+    """Returns the metrics in the Prometheus text exposition format"""
+    lines = []
+    def metric(name, kind, description, samples) :
+        lines.append('# HELP hwtest_{} {}'.format(name, description))
+        lines.append('# TYPE hwtest_{} {}'.format(name, kind))
+        for labels, value in samples :
+            lines.append('hwtest_{}{} {}'.format(name, labels, value))
+    metric('submissions', 'gauge', 'Submissions in the run.', [('', metrics['total'])])
+    metric('submissions_completed_total', 'counter', 'Submissions graded so far, including cached ones.',
+           [('', metrics['completed'])])
+    metric('submissions_cached', 'gauge', 'Submissions whose results came from the cache.',
+           [('', metrics['cached'])])
+    metric('elapsed_seconds', 'gauge', 'Seconds since the run started.',
+           [('', metrics['elapsed_seconds'])])
+    metric('submissions_per_second', 'gauge', 'Submissions graded per second.',
+           [('', metrics['submissions_per_second'])])
+    if metrics['eta_seconds'] is not None :
+        metric('eta_seconds', 'gauge', 'Estimated seconds until the run finishes.',
+               [('', metrics['eta_seconds'])])
+    metric('test_status_total', 'counter', 'Tests graded so far by status.',
+           [('{{status="{}"}}'.format(status), count)
+            for status, count in sorted(metrics['statuses'].items())])
+    metric('worker_elapsed_seconds', 'gauge', 'Seconds each worker has spent on its current student.',
+           [('{{worker="{}",student="{}"}}'.format(pid, worker['student']), worker['elapsed_seconds'])
+            for pid, worker in metrics['workers'].items()])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,167 @@
+"""
+Reference solutions for tests that check a student function on many inputs.
+The outputs of the reference solution are computed once per set of inputs,
+saved as .npy files and memory-mapped read-only by every worker, and the
+student's outputs are compared with them as whole arrays. Failure messages
+contain no colons, since StudentTestResult.process gives students the text
+after the last colon of a failed test's traceback.
+"""
+
+import os
+import pickle
+import marshal
+import hashlib
+import tempfile
+import numpy as np
+from hwcore import HWTestBase
+
+# arrays already mapped by this process, by cache file
+_mapped = {}
+
+
+def referenceKey(func, inputs) :
+    """Returns a hash of the code of func and of the inputs, which names
+    the cache file of their outputs"""
+    digest = hashlib.sha256()
+    digest.update(func.__qualname__.encode())
+    digest.update(marshal.dumps(func.__code__))
+    digest.update(pickle.dumps(inputs))
+    return digest.hexdigest()
+
+def computeOutputs(func, inputs) :
+    """Calls func on every input, a tuple of arguments or a single argument,
+    and returns the outputs stacked into one array"""
+    return np.asarray([func(*args) if isinstance(args, tuple) else func(args)
+                       for args in inputs])
+
+def referenceOutputs(func, inputs, directory='.reference_cache') :
+    """
+    Returns the outputs of the reference solution func on inputs as a
+    read-only array, computing them only if no process has before
+
+    Arguments :
+        func : function
+            reference solution
+        inputs : list
+            tuples of arguments, or single arguments, to call func with
+        directory : str
+            directory of the cached outputs
+    """
+
+    filename = os.path.join(directory, referenceKey(func, inputs) + '.npy')
+    if filename in _mapped :
+        return _mapped[filename]
+    if not os.path.exists(filename) :
+        outputs = computeOutputs(func, inputs)
+        if outputs.dtype == object :
+            raise TypeError('outputs of ' + func.__qualname__ + ' are not a numeric array')
+        if not os.path.exists(directory) :
+            os.makedirs(directory, exist_ok=True)
+        # written to a temporary file first, so workers that compute the
+        # same outputs at once never map a partly written file
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.npy', delete=False) as f :
+            np.save(f, outputs)
+        os.replace(f.name, filename)
+    _mapped[filename] = np.load(filename, mmap_mode='r')
+    return _mapped[filename]
+
+def describe(value) :
+    """Returns a short colon-free description of an input or output"""
+    text = repr(value)
+    if len(text) > 60 :
+        text = text[:57] + '...'
+    return text.replace(':', ' =')
+
+def mismatchReport(actual, expected, mismatched, inputs=None, limit=5) :
+    """
+    Returns a message listing the outputs that don't match, with the input
+    they were computed from when inputs is given
+
+    Arguments :
+        actual : array
+            outputs of the student
+        expected : array
+            outputs of the reference solution
+        mismatched : array
+            boolean array that is True where the outputs don't match
+        inputs : list
+            inputs the outputs were computed from, one per row
+        limit : int
+            number of mismatches listed
+    """
+
+    if inputs is not None and mismatched.ndim > 1 :
+        # an output row is wrong if any of its elements is
+        rows = mismatched.reshape(len(mismatched), -1).any(axis=1)
+    else :
+        rows = mismatched
+    count = int(np.count_nonzero(rows))
+    lines = ['{} of {} outputs are wrong'.format(count, rows.size)]
+    for index in np.argwhere(rows)[:limit] :
+        index = tuple(int(i) for i in index)
+        where = 'input ' + describe(inputs[index[0]]) if inputs is not None \
+            else 'index ' + describe(index if len(index) > 1 else index[0])
+        lines.append('{} expected {} got {}'.format(where, describe(expected[index].tolist()),
+                                                   describe(actual[index].tolist())))
+    if count > limit :
+        lines.append('and {} more'.format(count - limit))
+    return '\n'.join(lines)
+
+class ReferenceTestBase(HWTestBase):
+    """
+    Base class for tests that compare a student function with a reference
+    solution on many inputs. Outputs of the reference solution are cached
+    in reference_dir, and can be computed before grading starts by
+    overriding prepare:
+
+        @classmethod
+        def prepare(cls) :
+            cls.expected(solution.f, INPUTS)
+    """
+
+    reference_dir = '.reference_cache'
+
+    @classmethod
+    def expected(cls, func, inputs) :
+        """Returns the read-only outputs of the reference solution func on
+        inputs, see referenceOutputs"""
+        return referenceOutputs(func, inputs, cls.reference_dir)
+
+    def outputs(self, func, inputs) :
+        """Returns the outputs of the student function func on inputs as
+        one array"""
+        return computeOutputs(func, inputs)
+
+    def checkShape(self, actual, expected) :
+        if actual.shape != expected.shape :
+            self.fail('Outputs have shape {} but shape {} was expected'.format(
+                actual.shape, expected.shape))
+
+    def assertAllClose(self, actual, expected, rtol=1e-5, atol=1e-8, inputs=None, limit=5) :
+        """Fails unless every element of actual is close to expected, as
+        numpy.allclose, listing the first 'limit' mismatches"""
+        actual = np.asarray(actual)
+        expected = np.asarray(expected)
+        self.checkShape(actual, expected)
+        try :
+            mismatched = ~np.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True)
+        except TypeError :
+            self.fail('Outputs of type {} are not numbers'.format(actual.dtype))
+        if mismatched.any() :
+            self.fail(mismatchReport(actual, expected, mismatched, inputs, limit))
+
+    def assertAllEqual(self, actual, expected, inputs=None, limit=5) :
+        """Fails unless every element of actual equals expected, listing
+        the first 'limit' mismatches"""
+        actual = np.asarray(actual)
+        expected = np.asarray(expected)
+        self.checkShape(actual, expected)
+        mismatched = np.asarray(actual != expected)
+        if mismatched.any() :
+            self.fail(mismatchReport(actual, expected, mismatched, inputs, limit))
+
+    def assertMatchesReference(self, func, reference, inputs, rtol=1e-5, atol=1e-8, limit=5) :
+        """Fails unless the student function func gives the outputs of the
+        reference solution on every input"""
+        self.assertAllClose(self.outputs(func, inputs), self.expected(reference, inputs),
+                            rtol, atol, inputs, limit)
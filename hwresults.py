@@ -0,0 +1,366 @@
+"""
+Structured results store and the reports rendered from it. Results are
+appended to a JSON lines file as they come in, one record per student and
+one per test, and grades.txt, the feedback archive and the gradebook are all
+rendered from those records rather than from each other.
+"""
+
+import os
+import json
+import time
+import zipfile
+import collections
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ResultsStore:
+    """
+    Append-only JSON lines file of test results. Each student gets a
+    'student' record holding their score and how their file was submitted,
+    followed by a 'test' record for every test. A student that is stored
+    again replaces their earlier records when the store is loaded.
+
+    Tracebacks are kept once per failure signature, in a 'failure' record
+    written before the first test that has it, and test records refer to
+    them by signature. In memory every result with the same signature
+    shares one traceback string.
+
+    Arguments :
+        filename : str
+            path of the JSON lines file
+        mode : str
+            'w' to start a new store, 'a' to add to an existing one
+    """
+
+    def __init__(self, filename='results.jsonl', mode='w'):
+        self.filename = filename
+        self.f = open(filename, mode) if mode else None
+        # signature/traceback pairs of the failures stored so far
+        self.failures = {}
+
+    def append(self, name, result, **info):
+        """
+        Stores the result data of module 'name' and returns its record.
+        info holds the details needed to render the reports, i.e. the
+        submitted 'file' name, the 'penalty' message and the 'sis_id'.
+        """
+        record = dict(info, name=name, result=result)
+        student = {key: value for key, value in result.items() if key != 'tests'}
+        if 'tests' in result :
+            student['tests'] = len(result['tests'])
+        self.f.write(json.dumps(dict(info, type='student', name=name, result=student)) + '\n')
+        for test, entry in result.get('tests', {}).items() :
+            if 'signature' in entry :
+                signature = entry['signature']
+                if signature not in self.failures :
+                    self.failures[signature] = entry['raw']
+                    self.f.write(json.dumps({'type': 'failure', 'signature': signature,
+                                             'raw': entry['raw']}) + '\n')
+                entry['raw'] = self.failures[signature]
+                entry = {key: value for key, value in entry.items() if key != 'raw'}
+            self.f.write(json.dumps(dict(entry, type='test', name=name, test=test)) + '\n')
+        self.f.flush()
+        return record
+
+    def load(self):
+        """Returns a dictionary of name/record pairs, where each record has
+        the 'result' data of the student and the details it was stored with"""
+        records = {}
+        with open(self.filename) as f :
+            for line in f :
+                entry = json.loads(line)
+                kind = entry.pop('type')
+                if kind == 'similarity' :
+                    continue
+                if kind == 'failure' :
+                    self.failures.setdefault(entry['signature'], entry['raw'])
+                    continue
+                name = entry['name']
+                if kind == 'student' :
+                    result = entry['result']
+                    if 'tests' in result :
+                        result['tests'] = {}
+                    records[name] = entry
+                elif kind == 'test' :
+                    test = entry.pop('test')
+                    del entry['name']
+                    if 'signature' in entry :
+                        entry['raw'] = self.failures[entry['signature']]
+                    records[name]['result']['tests'][test] = entry
+        return records
+
+    def appendSimilarity(self, pairs, threshold):
+        """Stores the (name, name, similarity) pairs of similar submissions
+        found with threshold, which replace any stored before"""
+        self.f.write(json.dumps({'type': 'similarity', 'threshold': threshold,
+                                 'pairs': [list(pair) for pair in pairs]}) + '\n')
+        self.f.flush()
+
+    def similarity(self):
+        """Returns the threshold and pairs of similar submissions stored
+        last, or None if there are none"""
+        found = None
+        with open(self.filename) as f :
+            for line in f :
+                if '"similarity"' in line :
+                    entry = json.loads(line)
+                    if entry['type'] == 'similarity' :
+                        found = entry['threshold'], [tuple(pair) for pair in entry['pairs']]
+        return found
+
+    def close(self):
+        if self.f is not None :
+            self.f.close()
+
+def formatFeedback(record, output=False) :
+    """Returns the feedback text for one student, as it appears in
+    grades.txt and in their feedback file.
+
+    Args:
+        record - record of the student from the results store
+        output - include what the submission printed while graded
+    """
+
+    result = record['result']
+    lines = [record['name'] + '\n\n']
+    if result.get('warnings') :
+        lines.append('PRECHECK WARNINGS:\n' + '\n'.join(result['warnings']) + '\n\n')
+    if 'tests' in result :
+        for test in result['tests'].values() :
+            lines.append('TEST DESCRIPTION: ' + test['description'] + '\n')
+            lines.append('POINTS: {}'.format(test['points']) + '\n')
+            lines.append('STATUS: ' + test['status'] + '\n')
+            if 'message' in test:
+                lines.append('FEEDBACK: ' + test['message'] + '\n')
+            elif test['status'] == 'error' :
+                lines.append('RAW ERROR OUTPUT:\n' + test['raw']+'\n')
+            else:
+                lines.append('\n')
+            if output and test.get('output') :
+                lines.append('OUTPUT:\n' + test['output'].rstrip('\n') + '\n\n')
+    else :
+        lines.append(result['comment'] + '\n\n')
+    if output and result.get('output') :
+        lines.append('OUTPUT WHILE IMPORTING:\n' + result['output'].rstrip('\n') + '\n\n')
+
+    lines.append('TOTAL % FROM TESTS: {:.2f}\n'.format(result['percent']))
+    if record.get('penalty') :
+        lines.append('PENALTY: ' + record['penalty'] + '\n')
+        lines.append('ADJUSTED TOTAL: {:.2f}\n'.format(max([result['percent'] - 20.0, 0])))
+    lines.append('\n')
+    return ''.join(lines)
+
+def formatGrades(feedback) :
+    """Returns the grades.txt block around a student's feedback"""
+    return '-'*70 + '\n' + feedback + '*'*70 + '\n'
+
+def formatTimings(data, count=10) :
+    """Returns a report of the students and tests that took the longest to
+    grade, and the students that used the most memory.
+
+    Args:
+        data - dictionary of name/test result pairs
+        count - number of entries in each list
+    """
+
+    students = []
+    tests = []
+    averages = {}
+    for name, result in data.items() :
+        timings = result.get('timings')
+        if timings is None :
+            # e.g. rejected by the precheck
+            continue
+        students.append((timings['total'], timings['import'], timings.get('tests', 0),
+                         result.get('peak_memory'), name))
+        for test, entry in result.get('tests', {}).items() :
+            if 'timings' in entry :
+                times = entry['timings']
+                tests.append((times.get('total', 0), times.get('setUp', 0),
+                              times.get('test', 0), times.get('tearDown', 0), name, test))
+                averages.setdefault(test, []).append(times.get('total', 0))
+
+    lines = ['SLOWEST STUDENTS\n',
+             '{:>10} {:>10} {:>10} {:>10}  {}\n'.format('total s', 'import s', 'tests s',
+                                                  'peak MB', 'student')]
+    for total, imported, tested, memory, name in sorted(students, reverse=True)[:count] :
+        lines.append('{:10.3f} {:10.3f} {:10.3f} {:>10}  {}\n'.format(
+            total, imported, tested, '-' if memory is None else '{:.1f}'.format(memory), name))
+    lines.append('\nSLOWEST TESTS\n')
+    lines.append('{:>10} {:>10} {:>10} {:>10}  {}\n'.format('total s', 'setUp s', 'test s',
+                                                       'tearDown s', 'student: test'))
+    for total, setup, test_time, teardown, name, test in sorted(tests, reverse=True)[:count] :
+        lines.append('{:10.3f} {:10.3f} {:10.3f} {:10.3f}  {}: {}\n'.format(
+            total, setup, test_time, teardown, name, test))
+    lines.append('\nSLOWEST TESTS ON AVERAGE\n')
+    lines.append('{:>10} {:>10} {:>10}  {}\n'.format('mean s', 'max s', 'runs', 'test'))
+    means = sorted(((sum(times)/len(times), max(times), len(times), test)
+                    for test, times in averages.items()), reverse=True)
+    for mean, longest, runs, test in means[:count] :
+        lines.append('{:10.3f} {:10.3f} {:10d}  {}\n'.format(mean, longest, runs, test))
+    memory = sorted((student for student in students if student[3] is not None),
+                    key=lambda student: student[3], reverse=True)
+    if memory :
+        lines.append('\nMOST MEMORY\n')
+        lines.append('{:>10}  {}\n'.format('peak MB', 'student'))
+        for student in memory[:count] :
+            lines.append('{:10.1f}  {}\n'.format(student[3], student[4]))
+    return ''.join(lines)
+
+def formatFailures(data) :
+    """Returns a report of the failed tests grouped by failure signature,
+    most common first, with the students that have each failure and its
+    traceback shown once.
+
+    Args:
+        data - dictionary of name/test result pairs
+    """
+
+    groups = {}
+    for name, result in data.items() :
+        for test, entry in result.get('tests', {}).items() :
+            if 'signature' in entry :
+                group = groups.setdefault(entry['signature'], (test, entry, []))
+                group[2].append(name)
+    lines = ['FAILURES BY SIGNATURE ({} distinct)\n'.format(len(groups))]
+    for signature, (test, entry, names) in sorted(groups.items(),
+                                                  key=lambda group: (-len(group[1][2]), group[0])) :
+        lines.append('\n' + '='*70 + '\n')
+        lines.append('{} {}: {} ({} students)\n'.format(signature, test, entry['status'],
+                                                       len(names)))
+        lines.append('STUDENTS: ' + ', '.join(sorted(names)) + '\n')
+        lines.append(entry['raw'].rstrip('\n') + '\n')
+    if not groups :
+        lines.append('none\n')
+    return ''.join(lines)
+
+def renderFeedback(record, feedback_dir=None, output=False) :
+    """Formats the feedback of a student and returns it. The feedback is
+    also written to a file named after the file they submitted when
+    feedback_dir is given. output includes what the submission printed."""
+    feedback = formatFeedback(record, output)
+    if feedback_dir :
+        with open(os.path.join(feedback_dir, record['file'] + '.py'), 'w') as f :
+            f.write(feedback)
+    return feedback
+
+def _renderTask(task) :
+    return renderFeedback(*task)
+
+def renderAll(records, grades_file='grades.txt', archive=None, feedback_dir=None, processes=4,
+              output=False) :
+    """Renders grades.txt and the feedback of every record, formatting the
+    feedback in parallel.
+
+    Args:
+        records - dictionary of name/record pairs from ResultsStore.load
+        grades_file - path of the combined grades file
+        archive - FeedbackArchive the feedback is added to, or None
+        feedback_dir - directory for loose feedback files, or None to skip
+                       them
+        processes - number of parallel processes
+        output - include what each submission printed in its feedback
+    """
+
+    if feedback_dir and not os.path.exists(feedback_dir) :
+        os.makedirs(feedback_dir)
+    tasks = [(record, feedback_dir, output) for record in records.values()]
+    with mp.Pool(processes=processes) as pool, open(grades_file, 'w') as f :
+        for record, feedback in zip(records.values(), pool.imap(_renderTask, tasks, chunksize=16)) :
+            if archive is not None :
+                archive.add(record['file'], feedback)
+            f.write(formatGrades(feedback))
+
+class FeedbackArchive:
+    """Zip archive of feedback files to be reuploaded to canvas, written one
+    student at a time. Feedback is compressed and written in the order it
+    was given, on a background thread so grading goes on meanwhile, since
+    zlib releases the GIL while it compresses.
+
+    Args:
+        filename - path of the zip archive
+        background - write on a background thread, False to write in the
+                     calling thread
+    """
+
+    def __init__(self, filename='feedback.zip', background=True) :
+        self.zipf = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+        # a single thread, so only one writer ever touches the archive
+        self.executor = ThreadPoolExecutor(1) if background else None
+        self.pending = collections.deque()
+
+    def add(self, filename, feedback) :
+        """Adds the feedback for the submitted file 'filename'"""
+        if self.executor is None :
+            self.write(filename, feedback)
+            return
+        self.pending.append(self.executor.submit(self.write, filename, feedback))
+        self.flush(wait=False)
+
+    def flush(self, wait=True) :
+        """Raises any error writing the feedback written so far, waiting for
+        all of it to be written if wait is True"""
+        while self.pending and (wait or self.pending[0].done()) :
+            self.pending.popleft().result()
+
+    def write(self, filename, feedback) :
+        """Compresses the feedback and writes it to the archive"""
+        zinfo = zipfile.ZipInfo('feedback/' + filename + '.py', time.localtime()[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0o644 << 16
+        self.zipf.writestr(zinfo, feedback.encode())
+
+    def close(self) :
+        self.flush()
+        if self.executor is not None :
+            self.executor.shutdown()
+        self.zipf.close()
+
+class ResultWriter:
+    """Stores results as they come in and renders grades.txt and the
+    feedback of each student from the stored record.
+
+    Args:
+        store - ResultsStore the results are appended to
+        naughty - dictionary of name/message pairs for penalized submissions
+        modified - dictionary of name/original file name pairs
+        studentID - dictionary of student ID/name pairs
+        grades_file - path of the combined grades file
+        archive - FeedbackArchive the feedback is added to, or None
+        feedback_dir - directory for loose feedback files, or None to skip
+                       them
+        output - include what each submission printed in its feedback
+    """
+
+    def __init__(self, store, naughty, modified, studentID, grades_file='grades.txt',
+                 archive=None, feedback_dir=None, output=False) :
+        self.store = store
+        self.naughty = naughty
+        self.modified = modified
+        self.sis_ids = {name: sis_id for sis_id, name in studentID.items()}
+        self.archive = archive
+        self.feedback_dir = feedback_dir
+        self.output = output
+        if feedback_dir and not os.path.exists(feedback_dir) :
+            os.makedirs(feedback_dir)
+        self.grades = open(grades_file, 'w')
+
+    def record(self, name, result) :
+        """Stores the results of module 'name' and returns its record"""
+        return self.store.append(name, result, file=self.modified.get(name, name),
+                                 penalty=self.naughty.get(name),
+                                 sis_id=self.sis_ids.get(name))
+
+    def write(self, name, result) :
+        """Stores the results of module 'name' and appends them to the
+        reports"""
+        record = self.record(name, result)
+        feedback = renderFeedback(record, self.feedback_dir, output=self.output)
+        if self.archive is not None :
+            self.archive.add(record['file'], feedback)
+        self.grades.write(formatGrades(feedback))
+        self.grades.flush()
+
+    def close(self) :
+        self.grades.close()
@@ -0,0 +1,141 @@
+"""
+Similarity detection between submissions. Each file is reduced to a stream
+of normalized tokens, where names, numbers and strings lose their values,
+and fingerprinted by winnowing the hashes of its k-grams. A MinHash
+signature of the fingerprints puts similar submissions in the same bucket
+of an LSH index, so only candidate pairs are compared instead of every
+pair in the class.
+"""
+
+import io
+import random
+import hashlib
+import keyword
+import tokenize
+
+# tokens per k-gram, and k-grams per winnowing window
+K = 5
+WINDOW = 4
+# MinHash signature length, split into BANDS bands for the LSH index
+PERMUTATIONS = 64
+BANDS = 16
+PRIME = (1 << 61) - 1
+
+_random = random.Random(0)
+_HASHES = [(_random.randrange(1, PRIME), _random.randrange(PRIME)) for _ in range(PERMUTATIONS)]
+
+
+def normalizedTokens(source):
+    """Returns the tokens of Python source with identifiers, numbers and
+    strings replaced by placeholders and comments dropped, so renaming
+    variables or changing constants doesn't hide copied code"""
+    tokens = []
+    try :
+        for token in tokenize.generate_tokens(io.StringIO(source).readline) :
+            if token.type in (tokenize.COMMENT, tokenize.NL, tokenize.ENDMARKER) :
+                continue
+            if token.type == tokenize.NAME :
+                tokens.append(token.string if keyword.iskeyword(token.string) else 'V')
+            elif token.type == tokenize.NUMBER :
+                tokens.append('N')
+            elif token.type == tokenize.STRING :
+                tokens.append('S')
+            elif token.type == tokenize.INDENT :
+                tokens.append('>')
+            elif token.type == tokenize.DEDENT :
+                tokens.append('<')
+            elif token.type == tokenize.NEWLINE :
+                tokens.append(';')
+            else :
+                tokens.append(token.string)
+    except (tokenize.TokenError, SyntaxError) :
+        # files that don't compile are compared up to the error
+        pass
+    return tokens
+
+def winnow(tokens):
+    """Returns the set of fingerprints of a token stream, the smallest hash
+    of the k-grams in every window"""
+    hashes = [int.from_bytes(hashlib.blake2b(' '.join(tokens[i:i + K]).encode(),
+                                             digest_size=8).digest(), 'big')
+              for i in range(len(tokens) - K + 1)]
+    if len(hashes) <= WINDOW :
+        return set(hashes)
+    return {min(hashes[i:i + WINDOW]) for i in range(len(hashes) - WINDOW + 1)}
+
+def minhash(fingerprints):
+    """Returns the MinHash signature of a set of fingerprints"""
+    return [min((a*h + b) % PRIME for h in fingerprints) for a, b in _HASHES]
+
+def fingerprintFile(filename, ignore=(), source=None):
+    """
+    Fingerprints a submission
+
+    Arguments :
+        filename : str
+            path of the source
+        ignore : set
+            fingerprints to leave out, e.g. those of the starter code
+        source : bytes
+            the source itself, None to read it from filename
+
+    Returns :
+        fingerprints : list
+            sorted fingerprints of the file
+        signature : list
+            MinHash signature of the fingerprints, None if there are none
+    """
+
+    if source is None :
+        with open(filename, 'rb') as f :
+            source = f.read()
+    fingerprints = winnow(normalizedTokens(source.decode('utf-8', 'replace'))) - set(ignore)
+    if not fingerprints :
+        return [], None
+    return sorted(fingerprints), minhash(fingerprints)
+
+def findSimilar(prints, threshold):
+    """
+    Returns the pairs of submissions whose fingerprints are at least
+    threshold similar
+
+    Arguments :
+        prints : dict
+            dictionary of name/(fingerprint set, signature) pairs
+        threshold : float
+            smallest Jaccard similarity of the fingerprints of a pair that
+            is reported
+
+    Returns :
+        pairs : list
+            (name, name, similarity) of every similar pair, most similar
+            first
+    """
+
+    rows = PERMUTATIONS // BANDS
+    buckets = {}
+    for name, (fingerprints, signature) in prints.items() :
+        for band in range(BANDS) :
+            key = (band, tuple(signature[band*rows:(band + 1)*rows]))
+            buckets.setdefault(key, []).append(name)
+    candidates = set()
+    for names in buckets.values() :
+        for i, a in enumerate(names) :
+            for b in names[i + 1:] :
+                candidates.add((a, b) if a < b else (b, a))
+    pairs = []
+    for a, b in candidates :
+        fa, fb = prints[a][0], prints[b][0]
+        similarity = len(fa & fb)/len(fa | fb)
+        if similarity >= threshold :
+            pairs.append((a, b, similarity))
+    return sorted(pairs, key=lambda pair: (-pair[2], pair[0], pair[1]))
+
+def formatSimilarity(pairs, threshold):
+    """Returns the report of similar submissions"""
+    lines = ['SIMILAR SUBMISSIONS (similarity of at least {:.2f})\n'.format(threshold)]
+    for a, b, similarity in pairs :
+        lines.append('{:6.2f}  {}  {}\n'.format(similarity, a, b))
+    if not pairs :
+        lines.append('none\n')
+    return ''.join(lines)
@@ -0,0 +1,176 @@
+"""
+Statistics of a run from a students x tests matrix of small integer status
+codes and one of points earned. The matrix is folded from the results once,
+every statistic is computed from it with array operations, and it is saved
+as a .npz file for later analysis. Imported only when statistics are
+requested, since numpy is slow to load.
+"""
+
+import numpy as np
+
+# status code of each test result, MISSING where a test did not run
+STATUSES = ('pass', 'failure', 'error', 'timeout', 'resource', 'skipped')
+CODES = {status: code for code, status in enumerate(STATUSES)}
+MISSING = -1
+
+
+class ResultMatrix:
+    """
+    Results of a run as arrays
+
+    Arguments :
+        data : dict
+            dictionary of name/test result pairs
+        tests : list
+            names of the tests in the order of the columns, by default
+            every test any student ran, in the order they are first seen
+
+    Attributes :
+        names : array
+            name of the student of each row
+        tests : list
+            name of the test of each column
+        status : array
+            int8 status code of each student's result of each test, see
+            STATUSES, MISSING where the test did not run, e.g. because the
+            submission could not be imported
+        points : array
+            float32 points each student earned on each test
+        possible : array
+            float32 points each test is worth
+    """
+
+    def __init__(self, data, tests=None) :
+        if tests is None :
+            tests = {}
+            for result in data.values() :
+                tests.update(dict.fromkeys(result.get('tests', {})))
+        self.tests = list(tests)
+        self.names = np.array(list(data), dtype=str)
+        columns = {test: j for j, test in enumerate(self.tests)}
+        self.status = np.full((len(data), len(self.tests)), MISSING, dtype=np.int8)
+        self.possible = np.zeros(len(self.tests), dtype=np.float32)
+        for i, result in enumerate(data.values()) :
+            for test, entry in result.get('tests', {}).items() :
+                j = columns.get(test)
+                if j is None :
+                    continue
+                self.status[i, j] = CODES.get(entry['status'], MISSING)
+                self.possible[j] = entry['points']
+        self.points = ((self.status == CODES['pass'])*self.possible).astype(np.float32)
+
+    @classmethod
+    def load(cls, filename) :
+        """Returns the matrix saved to filename by save"""
+        matrix = cls.__new__(cls)
+        with np.load(filename) as f :
+            matrix.names = f['names']
+            matrix.tests = [str(test) for test in f['tests']]
+            matrix.status = f['status']
+            matrix.points = f['points']
+            matrix.possible = f['possible']
+        return matrix
+
+    def save(self, filename) :
+        """Saves the matrix, with the names of the status codes, as .npz"""
+        np.savez_compressed(filename, names=self.names, tests=np.array(self.tests, dtype=str),
+                            status=self.status, points=self.points, possible=self.possible,
+                            statuses=np.array(STATUSES))
+
+    def percent(self) :
+        """Returns the percent of the points each student earned, of the
+        points of the tests they ran, 0 for students that ran none"""
+        ran = ((self.status != MISSING)*self.possible).sum(axis=1)
+        return np.divide(100*self.points.sum(axis=1), ran, out=np.zeros(len(ran)), where=ran > 0)
+
+    def counts(self, rows=None) :
+        """Returns a tests x STATUSES array of how many students got each
+        status on each test, of the students in the boolean array rows"""
+        status = self.status if rows is None else self.status[rows]
+        return (status[:, :, np.newaxis] == np.arange(len(STATUSES))).sum(axis=0)
+
+    def rates(self, rows=None) :
+        """Returns the counts as percents of the students that ran each
+        test"""
+        counts = self.counts(rows)
+        ran = counts.sum(axis=1, keepdims=True)
+        return np.divide(100*counts, ran, out=np.zeros(counts.shape), where=ran > 0)
+
+    def histogram(self, bins=10) :
+        """Returns (counts, edges) of the students' percents, for the
+        students whose submission ran any test"""
+        tested = (self.status != MISSING).any(axis=1)
+        return np.histogram(self.percent()[tested], bins=bins, range=(0, 100))
+
+    def discrimination(self) :
+        """Returns the item discrimination of each test, the correlation of
+        passing it with the points earned on the other tests, nan where
+        every student passed or every student failed"""
+        tested = (self.status != MISSING).any(axis=1)
+        passed = (self.status[tested] == CODES['pass']).astype(np.float64)
+        rest = self.points[tested].sum(axis=1, keepdims=True) - self.points[tested]
+        passed -= passed.mean(axis=0)
+        rest -= rest.mean(axis=0)
+        spread = np.sqrt((passed**2).sum(axis=0)*(rest**2).sum(axis=0))
+        with np.errstate(invalid='ignore', divide='ignore') :
+            return np.where(spread > 0, (passed*rest).sum(axis=0)/spread, np.nan)
+
+    def sections(self, sections) :
+        """Returns (section, students, mean percent, pass rate of each
+        test) of every section
+
+        Arguments :
+            sections : dict
+                dictionary of name/section pairs, students that are not in
+                it are in section ''
+        """
+        labels = np.array([sections.get(name, '') for name in self.names], dtype=str)
+        groups, index = np.unique(labels, return_inverse=True)
+        sizes = np.bincount(index, minlength=len(groups))
+        means = np.bincount(index, weights=self.percent(), minlength=len(groups))/sizes
+        passed = np.zeros((len(groups), len(self.tests)))
+        ran = np.zeros((len(groups), len(self.tests)))
+        np.add.at(passed, index, self.status == CODES['pass'])
+        np.add.at(ran, index, self.status != MISSING)
+        rates = np.divide(100*passed, ran, out=np.zeros(passed.shape), where=ran > 0)
+        return [(groups[k], int(sizes[k]), means[k], rates[k]) for k in range(len(groups))]
+
+def formatStatistics(matrix, sections=None) :
+    """Returns the report of the statistics of a run
+
+    Arguments :
+        matrix : ResultMatrix
+            results of the run
+        sections : dict
+            dictionary of name/section pairs, None to leave out the
+            breakdown by section
+    """
+
+    width = max([len(test) for test in matrix.tests] + [4])
+    lines = ['TESTS (% of the students that ran each test)\n',
+             '{:<{}} '.format('test', width) + ' '.join('{:>8}'.format(status)
+                                                     for status in STATUSES)
+             + ' {:>8} {:>8}\n'.format('ran', 'discrim')]
+    counts = matrix.counts()
+    rates = matrix.rates()
+    discrimination = matrix.discrimination()
+    for j, test in enumerate(matrix.tests) :
+        lines.append('{:<{}} '.format(test, width) + ' '.join('{:8.1f}'.format(rate)
+                                                            for rate in rates[j])
+                     + ' {:8d} {:>8}\n'.format(int(counts[j].sum()),
+                                               'nan' if np.isnan(discrimination[j])
+                                               else '{:.2f}'.format(discrimination[j])))
+    counts, edges = matrix.histogram()
+    lines.append('\nSCORES (students by percent)\n')
+    for count, low, high in zip(counts, edges[:-1], edges[1:]) :
+        lines.append('{:5.0f}-{:<5.0f} {:6d} {}\n'.format(low, high, count,
+                                                          '#'*int(round(50*count/max(counts.max(), 1)))))
+    if sections :
+        lines.append('\nSECTIONS (mean %, then pass % of each test)\n')
+        lines.append('{:>8} {:>8} '.format('students', 'mean %')
+                     + ' '.join('{:>8.8}'.format(test) for test in matrix.tests) + '  section\n')
+        for section, size, mean, passed in matrix.sections(sections) :
+            lines.append('{:8d} {:8.1f} '.format(size, mean)
+                         + ' '.join('{:8.1f}'.format(rate) for rate in passed)
+                         + '  ' + (section or '(no section)') + '\n')
+    return ''.join(lines)
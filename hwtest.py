@@ -1,424 +1,257 @@
-import unittest
+import time
+_started = time.perf_counter()
 import re
 import sys
 import argparse
 import importlib
 import os
-import shutil
-import zipfile
-import csv
-import signal
-import numpy as np
-import matplotlib.pyplot as plt
-from sys import platform
+import tempfile
+import hashlib
+import json
+import sqlite3
 import multiprocessing as mp
+import hwcore
+import hwimport
+import hwprecheck
+import hwsimilarity
+from hwcore import (StudentTestLoader, StudentRunner, StudentTestResult,
+                    HWTestBase, ResourceLimitError, timeout, budget, runTests,
+                    GradingEngine, TestPlan, shardTasks)
+from hwimport import Submissions, readSubmission, cleanup_filename, matchSubmission
+from hwprogress import Progress
+from hwresults import (ResultsStore, ResultWriter, FeedbackArchive, renderAll, formatTimings,
+                       formatFailures)
+from hwgradebook import updateGrades, studentScores, studentSections
 
 
-class StudentTestLoader(unittest.TestLoader):
-       
-    def loadTestsFromTestCase(self, testCaseClass, **kwargs):
-        """Return a suite of all tests cases contained in testCaseClass."""
-        testCaseNames = self.getTestCaseNames(testCaseClass)
-        testCases = []
-        for testCaseName in testCaseNames:
-            testCases.append(testCaseClass(testCaseName, **kwargs))
-        loadedSuite = self.suiteClass(testCases)
-        return loadedSuite
+# statuses that depend on the budgets and on how loaded the machine was
+UNSETTLED = ('timeout', 'resource')
 
-class StudentRunner:
-    """Run the TestCase for a student module.
+class ResultCache:
     """
+    Single-file SQLite store of test results keyed by a hash of the
+    submission source, the grader, the test module and the modules it
+    imported from its own folder, and the options that affect grading, so
+    unchanged submissions don't have to be regraded. Results in which a test
+    or the import ran over its budget are not stored, since they may come
+    out differently on a less loaded machine.
 
-    def __init__(self, stream=sys.stderr):
-        self.stream = stream
-        self.msg = ''
-
-    def writeUpdate(self, message):
-        self.stream.write(message)
-
-    def run(self, test, mod):
-        """ Run the given test case or test suite.  """
-        result = StudentTestResult(self)
-        # The following updates will be written in the terminal
-        self.msg = "*"*70+"\n"
-        self.msg +="STUDENT: " + mod.__name__+"\n"
-        test(result)
-        result.process()
-        self.msg +="TOTAL: {}\n".format(result.data['total'])
-        self.msg +="SCORE: {}\n".format(result.data['score'])
-        self.msg +="~"*70+"\n\n"
-        self.writeUpdate(self.msg)
-        return result
-
-class StudentTestResult(unittest.TestResult):
-
-    def __init__(self, runner):
-        unittest.TestResult.__init__(self)
-        self.runner = runner
-        self.data = {}
-        self.data['tests'] = {}
-
-    def startTest(self, test):
-        unittest.TestResult.startTest(self, test)
-
-        # extract points
-        points = re.findall(r'(?<=points=)\d+', test._testMethodDoc)
-        if not points :
-            points = 1
-        else :
-            points = int(points[0])
-            
-        self.runner.msg += '{0}, {1}, {2} '.format(test._testMethodName, points, test.shortDescription())
-        self.data['tests'][test._testMethodName] = {}
-        self.data['tests'][test._testMethodName]['points'] = points
-        self.data['tests'][test._testMethodName]['description'] = test.shortDescription()
-        
-    def addSuccess(self, test):
-        unittest.TestResult.addSuccess(self, test)
-        self.data['tests'][test._testMethodName]['status'] = 'pass'
-        self.runner.msg += 'PASS\n'
-
-    def addError(self, test, err):
-        unittest.TestResult.addError(self, test, err)
-        self.data['tests'][test._testMethodName]['status'] = 'error'
-        self.runner.msg += 'ERROR\n'
-
-    def addFailure(self, test, err):
-        unittest.TestResult.addFailure(self, test, err)
-        self.data['tests'][test._testMethodName]['status'] = 'failure'
-        self.runner.msg += 'FAIL\n'
-
-    def process(self):
-        
-        # add the raw messages from exceptions due to errors
-        for test, raw in self.errors:
-            self.data['tests'][test._testMethodName]['raw'] = raw
-        # do the same for exceptions raided from test failures
-        for test, raw in self.failures:
-            self.data['tests'][test._testMethodName]['raw'] = raw
-            # extract the short message from failed test for delivery
-            # to the student
-            msg_idx = raw.rfind(':')
-            if msg_idx > -1:
-                self.data['tests'][test._testMethodName]['message'] = raw[msg_idx+2:]
-        # compute total points
-        score = 0
-        total = 0
-        for test in self.data['tests'].keys():
-            points = self.data['tests'][test]['points']
-            total += points
-            if self.data['tests'][test]['status'] == 'pass':
-                score += points
-        self.data['score'] = score
-        self.data['total'] = total
-        self.data['percent'] = 100*score/total
-        
-class timeout:
-    """ 
-    Class designed to handle infinite while loops. Returns TimeoutError 
-    after the specified time
-    """
-    def __init__(self, seconds=5, error_message='Timeout'):
-        self.seconds = seconds
-        self.error_message = error_message
-    def handle_timeout(self, signum, frame):
-        raise TimeoutError(self.error_message)
-    def __enter__(self):
-        signal.signal(signal.SIGALRM, self.handle_timeout)
-        signal.alarm(self.seconds)
-    def __exit__(self, type, value, traceback):
-        signal.alarm(0)
-        
-class HWTestBase(unittest.TestCase):
-    """
-    Base class for tests to be imported to tester
-    """
-    
-    def __init__(self, testname, module):
-        super().__init__(testname)
-        self.module = module
-        
-               
-def runTests(name, test_class):
-    """
-    Runs tests in test class for all of the filename 'name'
-    
     Arguments :
-        names : str
-            str of filename to be tested
-        test_class : HWTestBase class
-            class based on HWTestBase containing tests to be run
-            
-    Returns :
-        data : dict
-            dictionairy with name as key to dictionary containing
-            test results
+        filename : str
+            path of the SQLite database, created if it doesn't exist
     """
-    
-    data = {}
-    print("Testing ", name)
-    data[name] = {}
-    if platform in ['win32', 'win64'] :
-        print("I'm on Windoze and can't use signal!!!")
-    try:
-        with timeout(seconds=10) :
-            mod = importlib.import_module(name)
-    except TimeoutError :
-        data[name]['total'] = 0
-        data[name]['percent'] = 0
-        data[name]['comment'] = 'Likely an infinite while loop!'
-        print("Likely an infinite while loop!\n")
-    except:
-        data[name]['total'] = 0
-        data[name]['percent'] = 0
-        data[name]['comment'] = 'Importing led to an error.'
-        print("importing led to an error!\n")
-    else:
-        try:
-            loader = StudentTestLoader()
-            suite = loader.loadTestsFromTestCase(test_class, module=mod)
-            result = StudentRunner().run(suite, mod)
-            data[name] = result.data
-        except:
-            print("test suite failed!")
-    return data
 
-def gradingStatistics(data) :
-    """
-    Counts numper of passes, failures, and errors for each test
-    
-    Arguments : 
-        data : dict
-            dictionary containing dictionaries for each files test results
-            
-    Returns: 
-        stats : dict
-            dictionary containing dictionary of passes, failures, and errors
-            for each test
-    """
-    
-    # initializes the stats dictionary for each test
-    stats = {}
-    i = 0
-    name = list(data.keys())[i]
-    while not 'tests' in data[name].keys() :
-        i += 1
-        name = list(data.keys())[i]        
-    for test in data[name]['tests'] :
-        stats[test] = {'pass':0, 'failure': 0, 'error': 0, 'total':0}
-        
-    # fills in data from tests    
-    for name in data.keys() :
-        if 'tests' in data[name].keys() :
-            for test in data[name]['tests'] :
-                test_status = data[name]['tests'][test]['status']
-                stats[test][test_status] += 1
-                stats[test]['total'] += 1
+    def __init__(self, filename):
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results '
+                          '(key TEXT PRIMARY KEY, name TEXT, data TEXT, used REAL)')
+        self.started = time.time()
+        self.hits = 0
+        self.misses = 0
+        # everything but the submission itself is hashed once up front
+        self.grader = hashlib.sha256()
+        for filename in (__file__, hwcore.__file__, hwimport.__file__, hwprecheck.__file__) :
+            with open(filename, 'rb') as f :
+                self.grader.update(f.read())
+        self.suites = []
+
+    def addSuite(self, test_module, options) :
+        """Adds a suite of tests to key results of and returns its index
+
+        Arguments :
+            test_module : module
+                module containing the test class
+            options : dict
+                options that affect the results (test class, budgets, ...)
+        """
+        base = self.grader.copy()
+        for filename in localSources(test_module) :
+            base.update(filename.encode())
+            with open(filename, 'rb') as f :
+                base.update(f.read())
+        base.update(json.dumps(options, sort_keys=True).encode())
+        self.suites.append(base)
+        return len(self.suites) - 1
+
+    def key(self, name, suite=0, submissions=None) :
+        """Returns the cache key of module 'name' of the Submissions
+        graded with suite, or None if its source can't be found"""
+        filename, source = readSubmission(name, submissions)
+        if filename is None :
+            return None
+        digest = self.suites[suite].copy()
+        digest.update(source)
+        return digest.hexdigest()
+
+    def get(self, key) :
+        """Returns the stored result data for key, or None on a miss"""
+        row = None
+        if key is not None :
+            row = self.conn.execute('SELECT data FROM results WHERE key = ?',
+                                    (key,)).fetchone()
+        if row is None :
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute('UPDATE results SET used = ? WHERE key = ?',
+                          (self.started, key))
+        return json.loads(row[0])
+
+    def put(self, key, name, data) :
+        """Stores the result data of module 'name' under key, unless a test
+        or the import ran over its budget"""
+        if key is not None and settled(data) :
+            self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                              (key, name, json.dumps(data), self.started))
 
-    return stats
+    def prune(self) :
+        """Deletes every entry that wasn't used by this run and returns
+        how many were deleted"""
+        return self.conn.execute('DELETE FROM results WHERE used < ?',
+                                 (self.started,)).rowcount
 
-def plotStats(stats) :
+    def commit(self) :
+        self.conn.commit()
+
+    def close(self) :
+        self.conn.commit()
+        self.conn.close()
+
+def settled(result) :
+    """Checks whether the result data of a submission would come out the
+    same however loaded the machine is, i.e. no test and not the import ran
+    over its budget"""
+    if result.get('import_status') in UNSETTLED or result.get('status') in UNSETTLED :
+        # the import, or the worker grading it, ran over its budget
+        return False
+    return all(test['status'] not in UNSETTLED for test in result.get('tests', {}).values())
+
+def localSources(test_module) :
+    """Returns the sorted source files of test_module and of the modules
+    loaded from its folder, e.g. hwreference or a reference solution it
+    imported, leaving out installed packages"""
+    folder = os.path.dirname(os.path.abspath(test_module.__file__))
+    installed = tuple(os.path.abspath(prefix) + os.sep for prefix in (sys.prefix, sys.base_prefix))
+    sources = set()
+    for module in list(sys.modules.values()) :
+        filename = getattr(module, '__file__', None)
+        if not filename or not filename.endswith('.py') :
+            continue
+        filename = os.path.abspath(filename)
+        if filename.startswith(folder + os.sep) and not filename.startswith(installed) :
+            sources.add(filename)
+    return sorted(sources)
+
+# tests of a submission must take this many times as long as its import for
+# automatic sharding to split it
+SHARD_RATIO = 2
+
+class GradingHistory:
     """
-    Creates a stacked bar plot to visualize performance on each test
-    
+    JSON sidecar file of how long submissions took to grade in earlier
+    runs, used to start the submissions expected to take longest first so
+    the pool doesn't finish with a long tail on one worker. Each student of
+    an assignment keeps the seconds their last graded submission took, of
+    them the seconds spent importing it and running its tests, the cache
+    key of that submission and whether importing it timed out.
+
     Arguments :
-        stats : dict
-            dictionary containing dictionary of passes, failures, and errors
-            for each test
-            
-    Creates :
-        stats_plot.png : .png file
-            graphic representation of performance by test
-    """
-    
-    xticklabels = []
-    passes = np.array([])
-    fails = np.array([])
-    errors = np.array([])
-    totals = np.array([])
-    
-    # Appends each test name to xticklabels and makes arrays of the data
-    for test in stats.keys() :
-        xticklabels.append(test)
-        passes = np.append(passes, stats[test]['pass'])
-        fails = np.append(fails, stats[test]['failure'])
-        errors = np.append(errors, stats[test]['error'])
-        totals = np.append(totals, stats[test]['total'])
-    
-    # Normalizes the data by percentage
-    passes = passes*100/totals
-    fails = fails*100/totals
-    errors = errors*100/totals
-    
-    # Graph formatting
-    ind = np.arange(0, len(xticklabels)*2, 2)
-    width = 0.25
-    
-    # Plotting
-    plt.figure(figsize=(10,6), edgecolor='w')    
-    p1 = plt.barh(ind, passes, width, color=(0.41, 1.0, 0.62))
-    p2 = plt.barh(ind, fails, width, color=(1.0, 0.5, 0.62), left=passes)
-    p3 = plt.barh(ind, errors, width, color=(0.2588,0.4433,1.0), left=passes+fails)
-    
-    # Label and title
-    plt.xlabel('Percent')
-    plt.title('Grading Statistics', loc='left')
-    
-    # axis ticks and legend and layout
-    plt.yticks(ind, xticklabels, rotation='horizontal')
-    plt.xticks(np.arange(0,101, 10), rotation='horizontal')
-    plt.legend((p1[0], p2[0], p3[0]), ('Passes', 'Failures', 'Errors'), bbox_to_anchor=(1,1.06), loc='upper right',
-               ncol=3, borderaxespad=0.)
-    plt.tight_layout()
-    
-    # saves figure
-    plt.savefig('stats_plot.png')  
-    
-    
-def processResults(data, naughty, modified, directory) :
-    
-    f = open('grades.txt', 'w')
-    for name in data.keys() :
-        f.write('-'*70 + '\n')
-        f.write(name + '\n\n')
-        try :    
-            for test in data[name]['tests'] :
-                #f.write(test + '\n')
-                f.write('TEST DESCRIPTION: ' + data[name]['tests'][test]['description'] + '\n')
-                f.write('POINTS: {}'.format(data[name]['tests'][test]['points']) + '\n')
-                f.write('STATUS: ' + data[name]['tests'][test]['status'] + '\n') 
-                if 'message' in data[name]['tests'][test]:
-                    f.write('FEEDBACK: ' + data[name]['tests'][test]['message'] + '\n')
-                elif data[name]['tests'][test]['status'] == 'error' :
-                    f.write('RAW ERROR OUTPUT:\n' + data[name]['tests'][test]['raw']+'\n')
-                else:
-                    f.write('\n')
-        except :
-            f.write(data[name]['comment'] + '\n\n')
-
-        f.write('TOTAL % FROM TESTS: {:.2f}\n'.format(data[name]['percent']))
-        if name in naughty :
-            f.write('PENALTY: ' + naughty[name] + '\n')
-            f.write('ADJUSTED TOTAL: {:.2f}\n'.format(max([data[name]['percent'] - 20.0, 0])))            
-            
-        f.write('\n' + '*'*70 + '\n')
-    
-    f.close()
-    # delete the modified file    
-    for name in modified.keys() :
-        os.remove(directory+'/'+name+'.py')
-        
-def splitResults(modified) :
-    """Splits all results and overwrites the origal files with feedback to 
-    be zipped and reuploaded to canvas.
-    
-    Args:
-        directory - path to directory containing the submissions   
-    """
-    
-    #creates the feedback directory if it doesn't exist
-    if not os.path.exists('./feedback') :
-        os.makedirs('./feedback')
-        
-    #opens the already written grades file
-    f = open('grades.txt', 'r')    
-    #seperates the feedback for each student and stores in an array
-    feedback_array = f.read()[71:-72].split('*'*70+'\n'+'-'*70+'\n')
-    #close file
-    f.close()
-    
-    for feedback in feedback_array :
-        #get submitted file name
-        filename = modified[feedback[:feedback.index('\n')]]
-        #open file in feedback folder and write feedback into it
-        f = open('./feedback/' + filename + '.py', 'w')
-        f.write(feedback)
-        f.close()
-    # zips file    
-    zipf = zipfile.ZipFile('feedback.zip', 'w', zipfile.ZIP_DEFLATED)
-    for root, dirs, files in os.walk('./feedback') :
-        for file in files :
-            zipf.write(os.path.join(root, file))
-    zipf.close()
-    
-def updateGrades(grades_file, assignment, studentID) :
-    """Updates the grades csv with the scores from testing
-    
-    Args:
-        grades_file - name of csv file of gradebook downloaded from canvas
+        filename : str
+            path of the JSON file, created when the run is saved
     """
-    shutil.copyfile(grades_file, 'grades_backup.csv')
-    #opens csv files
-    csvfilein = csv.reader(open('grades_backup.csv', 'r'))
-    csvfileout = csv.writer(open(grades_file, 'w'))
-    
-    #gets header
-    headers = csvfilein.__next__()
-    #gets the index of the assignment for grade updates
-    canvas_assignment = [string for string in headers if re.match(assignment+' \(\d+\)', string)]
-    index = headers.index(canvas_assignment[0])
-    
-    csvfileout.writerow(headers[:5]+headers[index:index+1])
-    
-    #next line is whether assignment is muted or not
-    #preserved for all other assignments, assignment being graded muted for review on upload
-    muted = csvfilein.__next__()
-    muted[index] = 'Muted'
-    csvfileout.writerow(muted[:5]+muted[index:index+1])
-    
-    #next line is points for an assignment
-    #gets value of total points and stores for future use
-    #copies over to new csv
-    points = csvfilein.__next__()
-    assignment_points = points[index]
-    csvfileout.writerow(points[:5]+points[index:index+1])
-    
-    for row in csvfilein :
-        # name of student file for student with the ID contained in row
-        if row[1] in studentID :
-            name = studentID[row[1]]
-            # calcualtes score
-            score = float(data[name]['percent'])*float(assignment_points)/100
-            # updates score and writes to new csv
-            row[index] = score
-        else :
-            print(row[0] + ' had no submission for this assigment.')
-            
-        csvfileout.writerow(row[:5]+row[index:index+1])
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.students = {}
+        if os.path.exists(filename) :
+            try :
+                with open(filename) as f :
+                    self.students = json.load(f)
+            except ValueError :
+                # only the order of grading depends on it, start over
+                print('Ignoring unreadable grading history ' + filename)
+            if not isinstance(self.students, dict) :
+                self.students = {}
+
+    def expected(self, student, key, default) :
+        """Returns (import timed out, seconds) expected for grading the
+        submission with cache key 'key' of student, 'default' seconds if
+        the student has no history"""
+        entry = self.students.get(student)
+        if entry is None :
+            return False, default
+        if entry['key'] != key :
+            # a resubmission has likely fixed what made the import hang,
+            # but is still expected to be as slow as the last one
+            return False, entry['seconds']
+        return entry['import_timeout'], entry['seconds']
+
+    def order(self, runs, tasks) :
+        """Returns the (suite, name) tasks sorted longest expected first,
+        with submissions whose import timed out before all the rest"""
+        known = [entry['seconds'] for entry in self.students.values()]
+        default = sum(known)/len(known) if known else 0
+        def expected(task) :
+            suite, name = task[:2]
+            run = runs[suite]
+            timed_out, seconds = self.expected(run.historyName(name), run.keys.get(name), default)
+            return (not timed_out, -seconds)
+        return sorted(tasks, key=expected)
+
+    def shardable(self, student, key, auto) :
+        """Checks whether the submission with cache key 'key' of student is
+        worth splitting into shards, which each import it again: not when
+        its import timed out, and with auto, when the shards are chosen
+        for the run, not when its tests took less than SHARD_RATIO times as
+        long as its import"""
+        entry = self.students.get(student)
+        if entry is None :
+            return True
+        if entry['key'] == key and entry['import_timeout'] :
+            return False
+        if auto and 'test_seconds' in entry :
+            return entry['test_seconds'] >= SHARD_RATIO*entry['import_seconds']
+        return True
+
+    def record(self, student, key, result) :
+        """Stores how long the result of a submission took to grade"""
+        timings = result.get('timings')
+        if timings is None :
+            # rejected by the precheck, or its worker died
+            return
+        self.students[student] = {'seconds': timings['total'], 'key': key,
+                                  'import_seconds': timings['import'],
+                                  'test_seconds': timings.get('tests', 0),
+                                  'import_timeout': result.get('import_status') == 'timeout'}
+
+    def save(self) :
+        """Writes the history, replacing the file atomically"""
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f :
+            json.dump(self.students, f, indent=0, sort_keys=True)
+        os.replace(f.name, self.filename)
+
+def addSubmission(match, names, naughty, modified, studentID) :
+    """Adds a submission found by matchSubmission to the names and
+    dictionaries returned by load_names and returns the name of its
+    module. The file itself is imported under that name by hwimport."""
+    
+    newname, original, change, sis_id = match
+    #makes student ID number key to new file name
+    studentID[sis_id] = newname[:-3]
+    # Continue only if the name of the module is not already
+    # in the list of names.  This should almost always be true, but
+    # certain testing might leave junk in the folder.
+    if newname[:-3] not in names: 
         
-    
-                    
-def cleanup_filename(filename) :
-    """Checks files for characters that make the file unable to be imported
-    as a module and removes those characters from the filename so tests can
-    be run"""
-    original = filename
-    change = ''
-    if re.search("-\d+", filename) :
-        #Gets rid of canvas added -\d at end of file
-        filename = re.sub("-\d+", "", filename)
-    if '-' in filename :
-        # Gets rid of dashes
-        filename = filename.replace('-','_') 
-        change += '-'
-    if '#' in filename :
-        # Gets rid of pound sign (some students put 'hw#4' in their name)
-        filename = filename.replace('#','')  
-        change += '#'
-    if '+' in filename :
-        # Gets rid of pound sign (some students put 'hw#4' in their name)
-        filename = filename.replace('+','')  
-        change += '+'
-    if ' ' in filename :
-        # Gets rid of pound sign (some students put 'hw#4' in their name)
-        filename = filename.replace(' ','_')  
-        change += ' '
-    if '.' in filename[:-3] :
-        # Swithches periods to underscores since some students use them in 
-        # place of them. Does not replace the '.' in '.py'
-        filename = filename[:-3].replace('.', '_') + filename[-3:]
-        change += '.'
-    return filename, original, change 
+        names.append(newname[:-3]) # remove .py
+        if change :
+            naughty[newname[:-3]] = \
+                "Submitted file name contained one or more of the following: " + change
+
+    if newname != original:
+        modified[newname[:-3]] = original[:-3]
+    return newname[:-3]
 
 def load_names(pattern, exclude, directory):
     """ Get all the matching module names (possibly modified).
@@ -426,14 +259,15 @@ def load_names(pattern, exclude, directory):
     Args:
         pattern - regex pattern that matches submissions
         exclude - regex pattern that matches files not to be included
-        directory - path to directory containing the submissions
+        directory - path to directory, or zip file, containing the
+                    submissions
     Returns:
         names - list of strings representing modules to be tested
         naughty - dictionary of name/message pairs, where the name is
                   a file that had bad symbols (i.e., directions were not
                   followed)
-        modified - dictionary of name/location pairs where location
-                   is the modified file produced during filtering
+        modified - dictionary of name/original pairs for submissions
+                   whose file name had to be cleaned up
     """
     
     names = []
@@ -441,40 +275,454 @@ def load_names(pattern, exclude, directory):
     modified = {}
     studentID = {}
     
-    for filename in os.listdir(directory):
+    for member, match in Submissions(directory, pattern, exclude).submissions():
+        addSubmission(match, names, naughty, modified, studentID)
+
+    return names, naughty, modified, studentID
+
+def readManifest(filename) :
+    """Reads the assignments of a batch run from a JSON manifest.
+    
+    Args:
+        filename - path of a JSON file holding a list of assignments, each
+                   with the 'test_module', 'test_class' and 'directory' to
+                   grade it with, optionally its 'assignment' name in canvas
+                   and the 'output' directory for its reports
+    Returns:
+        assignments - list of dictionaries with all five keys, where the
+                      output defaults to the assignment name
+    """
+    
+    with open(filename) as f :
+        assignments = json.load(f)
+    for assignment in assignments :
+        for key in ('test_module', 'test_class', 'directory') :
+            if key not in assignment :
+                raise ValueError('assignment in ' + filename + ' has no ' + key)
+        assignment.setdefault('assignment', None)
+        assignment.setdefault('output', re.sub(r'\W+', '_', assignment['assignment']
+                                               or assignment['test_module']))
+    return assignments
+
+class AssignmentRun:
+    """Submissions, results and reports of one assignment in a run.
+    
+    Args:
+        assignment - dictionary describing the assignment, see readManifest
+        args - parsed command line arguments
+    """
+    
+    def __init__(self, assignment, args) :
+        self.assignment = assignment
+        self.directory = assignment['directory']
+        self.submissions = Submissions(self.directory, args.pattern, args.exclude)
+        self.output = assignment['output']
+        self.args = args
+        if not os.path.exists(self.output) :
+            os.makedirs(self.output)
+        self.names = []
+        self.naughty = {}
+        self.modified = {}
+        self.studentID = {}
+        self.data = {}
+        self.keys = {}
+        self.plan = None
+        self.writer = None
+        self.archive = None
+        self.finished = False
+        # (modification time, size) of the submitted files when they were
+        # last loaded, and when the directory was last polled
+        self.seen = {}
+        self.polled = {}
         
-        # First, clean up the filename by removing bad symbols.  This
-        # assumes that submissions won't have weird prefixes placed on them
-        # by Canvas that inject other symbols.  Maybe there is a way to 
-        # get the files as named upon submission?
-        filename, original, change = cleanup_filename(filename)
+    def path(self, filename) :
+        """Returns the path of a report of this assignment"""
+        return os.path.join(self.output, filename)
+    
+    def historyName(self, name) :
+        """Returns the name of module 'name' in the GradingHistory, which
+        is kept apart from other assignments' submissions of the student"""
+        return self.assignment['test_module'] + ':' + name
+    
+    def feedbackDir(self) :
+        if self.args.keep_feedback and not self.args.single :
+            return self.path('feedback')
+        return None
+    
+    def listing(self) :
+        """Returns a dictionary of file name/(modification time, size) pairs
+        of the submissions directory or zip file"""
+        return self.submissions.listing()
+    
+    def load(self) :
+        """Finds the submissions to grade"""
+        if self.args.single :
+            self.names = [self.args.single]
+        else:
+            # files that change after this are picked up by scan
+            self.seen = self.listing()
+            self.polled = dict(self.seen)
+            self.submissions.scan()
+            # get the names through file filtering
+            self.names, self.naughty, self.modified, self.studentID = \
+                load_names(self.args.pattern, self.args.exclude, self.directory)
+    
+    def scan(self) :
+        """Loads the submissions added or changed since they were last
+        loaded and returns their names. A file is only loaded once it is the
+        same in two polls in a row, so it isn't graded while being copied."""
+        listing = self.listing()
+        names = []
+        for filename, stat in listing.items() :
+            if self.seen.get(filename) == stat or self.polled.get(filename) != stat :
+                continue
+            self.seen[filename] = stat
+            match = self.submissions.match(filename)
+            if match is not None :
+                name = addSubmission(match, self.names, self.naughty,
+                                     self.modified, self.studentID)
+                self.writer.sis_ids[name] = match[3]
+                if name not in names :
+                    names.append(name)
+        self.polled = listing
+        if names :
+            self.submissions.scan()
+        return names
+    
+    def open(self) :
+        """Starts the reports, which are written as results come in"""
+        self.store = ResultsStore(self.path(self.args.results_file))
+        self.archive = None if self.args.single else FeedbackArchive(self.path('feedback.zip'))
+        self.writer = ResultWriter(self.store, self.naughty, self.modified, self.studentID,
+                                   self.path('grades.txt'), self.archive, self.feedbackDir(),
+                                   self.args.feedback_output)
         
-        # If the filename as cleaned is not excluded, check if it matches
-        # the pattern given by the caller.
-        if not re.search(exclude, filename) and re.search(pattern, filename): 
-            
-            # Modify the file name if it matched.
-            newname = re.search(pattern, filename).group()
-            #makes student ID number key to new file name
-            if not re.search('late', filename) :
-                studentID[filename.split('_')[1]] = newname[:-3]
-            else :
-                studentID[filename.split('_')[2]] = newname[:-3]
-            # Continue only if the name of the module is not already
-            # in the list of names.  This should almost always be true, but
-            # certain testing might leave junk in the folder.
-            if newname[:-3] not in names: 
-                
-                names.append(newname[:-3]) # remove .py
-                if change :
-                    naughty[newname[:-3]] = \
-                        "Submitted file name contained one or more of the following: " + change
-
-            if newname != original:
-                modified[newname[:-3]] = original[:-3]
-                shutil.copyfile(directory + '/' + original, directory + '/' + newname)
+    def write(self, name, result) :
+        """Adds the result of module 'name', to the results store only once
+        the reports are finished"""
+        self.data[name] = result
+        if self.finished :
+            self.writer.record(name, result)
+        else :
+            self.writer.write(name, result)
+    
+    def finish(self) :
+        """Completes the reports, while results can still be stored"""
+        if not self.finished :
+            self.writer.close()
+            if self.archive is not None :
+                self.archive.close()
+            self.finished = True
+    
+    def close(self) :
+        self.finish()
+        self.store.close()
+        
+    def render(self) :
+        """Rebuilds the reports from the results of an earlier run"""
+        self.store = ResultsStore(self.path(self.args.results_file), mode=None)
+        records = self.store.load()
+        self.data = {name: records[name]['result'] for name in records}
+        self.studentID = {records[name]['sis_id']: name for name in records
+                          if records[name].get('sis_id')}
+        self.renderRecords(records)
+        found = self.store.similarity()
+        if found is not None :
+            self.writeSimilarity(found[1], found[0])
+    
+    def refresh(self) :
+        """Rebuilds the finished reports from the results store, once results
+        have been added to it"""
+        self.renderRecords(self.store.load())
+    
+    def renderRecords(self, records) :
+        archive = None if self.args.single else FeedbackArchive(self.path('feedback.zip'))
+        renderAll(records, self.path('grades.txt'), archive, self.feedbackDir(),
+                  self.args.processes, self.args.feedback_output)
+        if archive is not None :
+            archive.close()
+    
+    def writeSimilarity(self, pairs, threshold) :
+        """Stores the pairs of similar submissions and writes them to
+        similarity.txt"""
+        if self.store.f is not None :
+            self.store.appendSimilarity(pairs, threshold)
+        with open(self.path('similarity.txt'), 'w') as f :
+            f.write(hwsimilarity.formatSimilarity(pairs, threshold))
+    
+    def writeTimings(self) :
+        """Writes the slowest students and tests to timings.txt"""
+        with open(self.path('timings.txt'), 'w') as f :
+            f.write(formatTimings(self.data, self.args.slowest))
+    
+    def writeFailures(self) :
+        """Writes the failed tests grouped by signature to failures.txt"""
+        with open(self.path('failures.txt'), 'w') as f :
+            f.write(formatFailures(self.data))
+    
+    def sections(self) :
+        """Returns a dictionary of name/section pairs from the gradebook,
+        None without a gradebook or if it has no sections"""
+        if not self.args.grades_file or not os.path.exists(self.args.grades_file) :
+            return None
+        sections = studentSections(self.args.grades_file)
+        return {name: sections[sis_id] for sis_id, name in self.studentID.items()
+                if sis_id in sections} or None
+    
+    def writeStatistics(self) :
+        """Folds the results into a students x tests ResultMatrix, saved as
+        results.npz, and writes the statistics computed from it to
+        stats.txt and stats_plot.png"""
+        # the statistics are the only part that needs numpy and matplotlib
+        from hwstats import ResultMatrix, formatStatistics
+        from hwplot import plotStats
+        matrix = ResultMatrix(self.data, self.plan.names if self.plan is not None else None)
+        matrix.save(self.path('results.npz'))
+        with open(self.path('stats.txt'), 'w') as f :
+            f.write(formatStatistics(matrix, self.sections()))
+        plotStats(matrix, self.path('stats_plot.png'))
 
-    return names, naughty, modified, studentID
+def lookupCached(runs, suite, names, cache, args) :
+    """Writes the cached results of the submissions 'names' of runs[suite]
+    and returns the (suite, name) tasks of those that need grading"""
+    run = runs[suite]
+    todo = []
+    for name in names :
+        run.keys[name] = cache.key(name, suite, run.submissions)
+        # profiled submissions are always graded again
+        cached = cache.get(None if args.no_cache or name in args.profile else run.keys[name])
+        if cached is not None :
+            run.write(name, cached)
+        else :
+            todo.append((suite, name))
+    return todo
+
+def gradeTasks(engine, runs, todo, cache, history, args, cached=0) :
+    """Prechecks and grades the (suite, name) tasks with engine, longest
+    expected first from the GradingHistory, writing the results to their
+    runs, the cache and the history as they come in. The progress also
+    counts the 'cached' submissions whose results came from the cache."""
+    progress = None
+    if args.progress or args.metrics_file :
+        progress = Progress(len(todo) + cached, sys.stderr if args.progress else None,
+                            args.metrics_file, args.metrics_interval, cached)
+        progress.attach(engine.events)
+    try :
+        gradeTodo(engine, runs, todo, cache, history, args, progress)
+    finally :
+        if progress is not None :
+            progress.close()
+        history.save()
+
+def gradeTodo(engine, runs, todo, cache, history, args, progress) :
+    """Grades the tasks of gradeTasks, counting each result in progress
+    unless it is None"""
+    flagged = {}
+    if not args.no_precheck :
+        # reject files that can't be compiled or may stall a worker, unless
+        # those are to be graded anyway under the import budget
+        clean = set(todo)
+        for suite, name, errors, warnings in engine.precheck(todo, args.chunksize) :
+            if not args.grade_flagged :
+                errors = errors + warnings
+            if errors :
+                clean.discard((suite, name))
+                result = {'total': 0, 'percent': 0, 'precheck': errors,
+                          'comment': 'Submission was not tested:\n' + '\n'.join(errors)}
+                print('Precheck failed for ' + name + ': ' + '; '.join(errors))
+                runs[suite].write(name, result)
+                cache.put(runs[suite].keys[name], name, result)
+                if progress is not None :
+                    progress.done(name, result)
+            elif warnings :
+                flagged[suite, name] = warnings
+                print('Precheck flagged ' + name + ': ' + '; '.join(warnings))
+        todo = [task for task in todo if task in clean]
+    todo = history.order(runs, todo)
+    shards = shardTodo(runs, todo, history, args)
+    for suite, result in engine.grade(todo, args.chunksize, shards) :
+        for name in result :
+            if (suite, name) in flagged :
+                result[name]['warnings'] = flagged[suite, name]
+            runs[suite].write(name, result[name])
+            cache.put(runs[suite].keys[name], name, result[name])
+            history.record(runs[suite].historyName(name), runs[suite].keys[name], result[name])
+            if progress is not None :
+                progress.done(name, result[name])
+
+def shardTodo(runs, todo, history, args) :
+    """Returns the shards, see shardTasks, the (suite, name) tasks are
+    graded in. Nothing is sharded unless asked for with --shard_size or
+    --auto_shard, or with --fail_fast, so its count covers all of a
+    student's tests. Profiled submissions are graded whole, so their
+    profile is complete, and so are those the history says aren't worth
+    importing again for every shard."""
+    if not (args.shard_size or args.auto_shard) or args.fail_fast :
+        return {}
+    keep = set()
+    for suite, name in todo :
+        run = runs[suite]
+        if name in args.profile or not history.shardable(run.historyName(name), run.keys.get(name),
+                                                         not args.shard_size) :
+            keep.add((suite, name))
+    return shardTasks(todo, [run.plan for run in runs], args.processes, args.shard_size, keep)
+
+def detectSimilarity(engine, runs, args, suites=None) :
+    """Fingerprints the submissions of every assignment on the workers and
+    reports the pairs that are at least args.similarity similar.
+    
+    Args:
+        engine - GradingEngine of the run
+        runs - list of the AssignmentRun of every assignment
+        args - parsed command line arguments
+        suites - indices of the runs to check, None for all of them
+    """
+    
+    if suites is None :
+        suites = range(len(runs))
+    ignore = ()
+    if args.similarity_base :
+        # fingerprints of the starter code don't count as copying
+        ignore = hwsimilarity.fingerprintFile(args.similarity_base)[0]
+    tasks = [(suite, name, ignore) for suite in suites for name in runs[suite].names]
+    prints = {suite: {} for suite in suites}
+    for suite, name, fingerprints, signature in engine.fingerprint(tasks, args.chunksize) :
+        if fingerprints :
+            prints[suite][name] = (set(fingerprints), signature)
+    for suite in suites :
+        pairs = hwsimilarity.findSimilar(prints[suite], args.similarity)
+        if pairs :
+            print('{} pairs of similar submissions, see {}'.format(
+                len(pairs), runs[suite].path('similarity.txt')))
+        runs[suite].writeSimilarity(pairs, args.similarity)
+
+def watchAssignments(engine, runs, cache, history, args) :
+    """Grades submissions as they are added to or changed in the
+    submissions directories, on the workers of the first pass, until
+    interrupted. The results store of each assignment grows as results come
+    in, and its reports are rebuilt from the store after each change.
+    
+    Args:
+        engine - GradingEngine the first pass was graded on
+        runs - list of the AssignmentRun of every assignment
+        cache - ResultCache of the run
+        history - GradingHistory of the run
+        args - parsed command line arguments
+    """
+    
+    for run in runs :
+        run.finish()
+    cache.commit()
+    print('Watching for submissions every {:g} s, press Ctrl-C to stop'.format(args.watch_interval))
+    try :
+        while True :
+            time.sleep(args.watch_interval)
+            changed = []
+            todo = []
+            hits = cache.hits
+            for suite, run in enumerate(runs) :
+                names = run.scan()
+                if names :
+                    print('New or changed submissions: ' + ', '.join(names))
+                    changed.append(run)
+                    todo += lookupCached(runs, suite, names, cache, args)
+            if not changed :
+                continue
+            gradeTasks(engine, runs, todo, cache, history, args, cache.hits - hits)
+            cache.commit()
+            if args.similarity and not args.single :
+                detectSimilarity(engine, runs, args, [runs.index(run) for run in changed])
+            for run in changed :
+                run.refresh()
+                run.writeFailures()
+                if args.slowest :
+                    run.writeTimings()
+                if not args.no_plot :
+                    run.writeStatistics()
+    except KeyboardInterrupt :
+        print('Stopped watching')
+
+def gradeAssignments(assignments, args, limits) :
+    """Grades the submissions of every assignment on one shared worker pool.
+    
+    Args:
+        assignments - list of assignments, see readManifest
+        args - parsed command line arguments
+        limits - default budgets for each test
+    Returns:
+        runs - list of the AssignmentRun of every assignment whose test
+               class could be imported
+    """
+    
+    cache = ResultCache(args.cache_file)
+    history = GradingHistory(args.history_file)
+    runs = []
+    suites = []
+    for assignment in assignments :
+        # import test class
+        try:
+            tm = importlib.import_module(assignment['test_module'])
+            test_class = getattr(tm, assignment['test_class'])
+        except:
+            print("Error importing " + assignment['test_class'] + " from " + assignment['test_module'])
+            continue
+        # compile the plan of the tests once, shared with every worker
+        plan = TestPlan(test_class, limits)
+        try:
+            plan.validate()
+        except ValueError as err:
+            print("Invalid tests in " + assignment['test_module'] + ": " + str(err))
+            continue
+        try:
+            test_class.prepare()
+        except Exception as err:
+            print("Error preparing " + assignment['test_class'] + ": " + repr(err))
+            continue
+        print("{}: {} tests worth {} points".format(assignment['assignment'] or assignment['test_module'],
+                                                    len(plan.names), plan.total))
+        # the index of a suite is the same in the cache, the engine and runs
+        cache.addSuite(tm, {'test_module': assignment['test_module'],
+                            'test_class': assignment['test_class'], 'limits': limits,
+                            'import_timeout': args.import_timeout, 'isolate': args.isolate,
+                            'grade_flagged': args.grade_flagged})
+        runs.append(AssignmentRun(assignment, args))
+        runs[-1].plan = plan
+        suites.append((assignment['test_module'], assignment['test_class'],
+                       runs[-1].submissions))
+        
+    # look up unchanged submissions in the cache
+    todo = []
+    for suite, run in enumerate(runs) :
+        run.load()
+        run.open()
+        todo += lookupCached(runs, suite, run.names, cache, args)
+    
+    # cProfile stats of the selected submissions go to the profiles folder
+    profile = {}
+    for suite, run in enumerate(runs) :
+        for name in args.profile :
+            profile[(suite, name)] = run.path(os.path.join('profiles', name + '.prof'))
+        if args.profile and not os.path.exists(run.path('profiles')) :
+            os.makedirs(run.path('profiles'))
+    
+    # Parallization of testing, results are written as they come in
+    with GradingEngine(suites, args.processes, limits, args.import_timeout,
+                       args.start_method, args.recycle, args.isolate, profile,
+                       [run.plan for run in runs], bool(args.progress or args.metrics_file),
+                       args.quiet) as engine :
+        print('Startup: {:.3f} s'.format(time.perf_counter() - _started))
+        gradeTasks(engine, runs, todo, cache, history, args, cache.hits)
+        if args.similarity and not args.single :
+            detectSimilarity(engine, runs, args)
+        if args.watch :
+            watchAssignments(engine, runs, cache, history, args)
+    for run in runs :
+        run.close()
+    print('Cache: {} hits, {} misses'.format(cache.hits, cache.misses))
+    if args.prune_cache :
+        print('Pruned {} cached results'.format(cache.prune()))
+    cache.close()
+    return runs
 
 if __name__ == "__main__":
     # Set up parser
@@ -486,10 +734,10 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--single", help="name of single module to test",
                         default=None)
     parser.add_argument("-p", "--pattern", help="regex pattern to be matched by tested modules",
-                        default="[A-Za-z]+_[A-Za-z]+_(?i)h(?i)w\d+.py")
+                        default="(?i)[A-Za-z]+_[A-Za-z]+_hw\d+.py")
     parser.add_argument("-e", "--exclude", help="regex pattern to be excluded by tested modules",
                         default=r"test|solution|definition")
-    parser.add_argument("-d", "--directory", help="directory with submissions to be tested",
+    parser.add_argument("-d", "--directory", help="directory, or Canvas zip download, with submissions to be tested",
                         default="./submissions")
     parser.add_argument("-g", "--grades_file", help="csv of canvas gradebook",
                         default=None)
@@ -497,44 +745,116 @@ if __name__ == "__main__":
                         default=None)
     parser.add_argument("-o", "--open_stats", help="bool, True opens stats_plot at end of testing",
                         default=False)
-    parser.add_argument("-pr", "--processes", help="number of parallel processes",
-                        default=4, type=int)
+    parser.add_argument("-pr", "--processes", help="number of parallel processes, default is the number of cores",
+                        default=os.cpu_count() or 4, type=int)
+    parser.add_argument("-it", "--import_timeout", help="seconds allowed for importing a submission",
+                        default=10, type=float)
+    parser.add_argument("-tt", "--test_timeout", help="default wall-clock seconds allowed for each test",
+                        default=10, type=float)
+    parser.add_argument("-ct", "--cpu_limit", help="default CPU seconds allowed for each test",
+                        default=10, type=float)
+    parser.add_argument("-ml", "--memory_limit", help="default megabytes of memory allowed for each test",
+                        default=1024, type=float)
+    parser.add_argument("-cf", "--cache_file", help="SQLite file caching results of unchanged submissions",
+                        default=".grade_cache.sqlite")
+    parser.add_argument("-hf", "--history_file", help="JSON file of how long each submission took to grade, used to grade the slowest first",
+                        default=".grade_history.json")
+    parser.add_argument("-nc", "--no_cache", help="regrade every submission instead of using cached results",
+                        action="store_true")
+    parser.add_argument("-pc", "--prune_cache", help="delete cached results not used by this run",
+                        action="store_true")
+    parser.add_argument("-cs", "--chunksize", help="number of submissions handed to a process at a time",
+                        default=1, type=int)
+    parser.add_argument("-sm", "--start_method", help="how worker processes are started, default is the platform's",
+                        default=None, choices=mp.get_all_start_methods())
+    parser.add_argument("-rc", "--recycle", help="replace a worker after it grades this many tasks, 0 never",
+                        default=0, type=int)
+    parser.add_argument("-np", "--no_plot", help="skip the statistics, the plot and their numpy/matplotlib imports",
+                        action="store_true")
+    parser.add_argument("-is", "--isolate", help="run each test in its own fork of the imported submission, this many at a time, 0 never",
+                        default=0, type=int)
+    parser.add_argument("-npc", "--no_precheck", help="skip compiling and scanning submissions before testing them",
+                        action="store_true")
+    parser.add_argument("-gf", "--grade_flagged", help="grade submissions the precheck flags as likely to stall instead of rejecting them",
+                        action="store_true")
+    parser.add_argument("-rf", "--results_file", help="JSON lines file the results are stored in",
+                        default="results.jsonl")
+    parser.add_argument("-ro", "--render_only", help="render the reports from the results file without grading",
+                        action="store_true")
+    parser.add_argument("-kf", "--keep_feedback", help="also write the feedback files to ./feedback",
+                        action="store_true")
+    parser.add_argument("-m", "--manifest", help="JSON file listing several assignments to grade on one pool",
+                        default=None)
+    parser.add_argument("-w", "--watch", help="keep grading new and changed submissions until interrupted",
+                        action="store_true")
+    parser.add_argument("-wi", "--watch_interval", help="seconds between polls of the submissions directory",
+                        default=5, type=float)
+    parser.add_argument("-sl", "--slowest", help="number of slowest students and tests listed in timings.txt, 0 for none",
+                        default=10, type=int)
+    parser.add_argument("-ff", "--fail_fast", help="skip the rest of a student's tests once this many did not pass, 0 never",
+                        default=0, type=int)
+    parser.add_argument("-sh", "--shard_size", help="number of tests of a submission graded as one task, 0 to not split submissions",
+                        default=0, type=int)
+    parser.add_argument("-as", "--auto_shard", help="split the tests of submissions into shards when there are fewer submissions than processes",
+                        action="store_true")
+    parser.add_argument("-si", "--similarity", help="smallest similarity of submissions reported in similarity.txt, 0 to not check",
+                        default=0.8, type=float)
+    parser.add_argument("-sb", "--similarity_base", help="starter code whose fingerprints don't count as similar",
+                        default=None)
+    parser.add_argument("-pf", "--profile", help="names of modules whose cProfile stats are written to ./profiles",
+                        default=[], nargs='+')
+    parser.add_argument("-tl", "--traceback_limit", help="most characters kept of a failed test's traceback, 0 for all",
+                        default=2000, type=int)
+    parser.add_argument("-ol", "--output_limit", help="bytes kept of what a submission prints while graded, 0 to leave it on the console",
+                        default=10000, type=int)
+    parser.add_argument("-fo", "--feedback_output", help="include what a submission printed in its feedback",
+                        action="store_true")
+    parser.add_argument("-pg", "--progress", help="show the progress of grading on one refreshed line",
+                        action="store_true")
+    parser.add_argument("-q", "--quiet", help="don't print the results of each student from the workers",
+                        action="store_true")
+    parser.add_argument("-mf", "--metrics_file", help="file the metrics of the run are written to while grading, Prometheus text if it ends in .prom, JSON otherwise",
+                        default=None)
+    parser.add_argument("-mi", "--metrics_interval", help="seconds between refreshes of the progress and metrics file",
+                        default=2, type=float)
     args = parser.parse_args()    
-    
-    # add directory to path
-    sys.path.append(args.directory)
-    
-    # import test class
-    try:
-        tm = importlib.import_module(args.test_module)
-        tc = getattr(tm, args.test_class)
-    except:
-        print("Error importing " + args.test_class + " from " + args.test_module)
-    else:
-        # if single file to test
-        if args.single :
-            names = [args.single]
-            naughty = {}
-            modified = {}
-        else:
-            # get the names through file filtering
-            names, naughty, modified, studentID = load_names(args.pattern, args.exclude, args.directory)
-        # Parallization of testing
-        pool = mp.Pool(processes=args.processes)
-        results = [pool.apply_async(runTests, args=(name,tc)) for name in names] 
-        data_list = [p.get() for p in results]
-        data = {}
-        for result in data_list :
-            data = {**data, **result}
-        stats = gradingStatistics(data)
-        processResults(data, naughty, modified, args.directory)
-        if not args.single :
-            splitResults(modified)
-            if args.grades_file and args.assignment:
-                updateGrades(args.grades_file, args.assignment, studentID)
-            else :
-                print('pass the assignment name and csv of canvas grade book to produce an updated grades csv')
-        plotStats(stats)
-        if args.open_stats :
-            os.system('open stats_plot.png')
-            
\ No newline at end of file
+    if args.watch and (args.single or args.render_only) :
+        parser.error('--watch grades a directory of submissions, not --single or --render_only')
+    limits = {'timeout': args.test_timeout, 'cpu': args.cpu_limit,
+              'memory': args.memory_limit, 'failures': args.fail_fast,
+              'traceback': args.traceback_limit, 'output': args.output_limit}
+    
+    if args.manifest :
+        assignments = readManifest(args.manifest)
+    else :
+        assignments = [{'test_module': args.test_module, 'test_class': args.test_class,
+                        'directory': args.directory, 'assignment': args.assignment,
+                        'output': '.'}]
+    # add directories to path
+    for assignment in assignments :
+        sys.path.append(assignment['directory'])
+    
+    if args.render_only :
+        runs = [AssignmentRun(assignment, args) for assignment in assignments]
+        for run in runs :
+            run.render()
+    else :
+        runs = gradeAssignments(assignments, args, limits)
+    
+    for run in runs :
+        if run.data :
+            run.writeFailures()
+        if run.data and args.slowest :
+            run.writeTimings()
+        if run.data and not args.no_plot :
+            run.writeStatistics()
+            if args.open_stats :
+                os.system('open ' + run.path('stats_plot.png'))
+    if runs and not args.single :
+        # one gradebook update covers every assignment
+        scores = {run.assignment['assignment']: studentScores(run.studentID, run.data)
+                  for run in runs if run.assignment['assignment']}
+        if args.grades_file and scores :
+            updateGrades(args.grades_file, scores)
+        else :
+            print('pass the assignment name and csv of canvas grade book to produce an updated grades csv')
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from hwtest import HWTestBase, StudentTestLoader, StudentRunner
+from hwcore import HWTestBase, StudentTestLoader, StudentRunner
 
 class TestHW(HWTestBase) :
 